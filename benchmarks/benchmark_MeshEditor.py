@@ -0,0 +1,168 @@
+##
+# headless benchmarks of the MeshEditor functions on synthetic meshes, written to a json report
+# run from the command line, e.g.
+#     python benchmarks/benchmark_MeshEditor.py --sizes 10000 100000 --output report.json
+# each timing is the fastest of --repeats runs, the meshes and brush positions are generated from --seed so runs are comparable
+import argparse
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+
+import numpy as np
+import pyvista as pv
+from scipy.sparse.csgraph import dijkstra
+import MeshEditor.MeshEditor as ME
+
+pv.OFF_SCREEN = True
+
+
+def syntheticMesh(nVertices, seed):
+    # closed, slightly noisy sphere with about nVertices vertices
+    res = max(int(np.sqrt(nVertices)), 4)
+    shp = pv.Sphere(radius=100, theta_resolution=res, phi_resolution=res + 2)
+    rng = np.random.default_rng(seed)
+    shp.points = shp.points * (1 + 0.01 * rng.standard_normal((shp.n_points, 1)))
+    return shp
+
+
+def timeIt(fn, repeats):
+    # seconds of each run of fn
+    out = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t)
+    return out
+
+
+def editorState(shp):
+    # MeshEditor with the state needed by VertexRGB, without opening a plotter
+    editor = ME.MeshEditor.__new__(ME.MeshEditor)
+    editor.mesh = shp
+    editor.SelectedVertices = np.zeros(shp.n_points, dtype=bool)
+    editor.SelectedVertices[::3] = True
+    editor.VerticesInRadius = np.zeros(shp.n_points, dtype=bool)
+    editor.VerticesInRadius[::7] = True
+    editor.VertexSelectionMode = 'Brushing'
+    return editor
+
+
+def meshBenchmarks(shp, seed, workDir):
+    # name: function to time, for one mesh
+    rng = np.random.default_rng(seed)
+    topology = ME.MeshTopology(shp)
+    points = np.asarray(shp.points)
+    brushRadius = ME.meshRadius(points) / 10
+    centres = points[rng.integers(0, shp.n_points, 100)]
+    tree = ME.cKDTree(points)
+    editor = editorState(shp)
+    masks = [rng.random(shp.n_points) < 0.01 for _ in range(5)] # masks[i] is cut to the size of the mesh after i deletions
+    objFile = os.path.join(workDir, 'mesh.obj')
+    cacheDir = os.path.join(workDir, 'cache')
+    ME.writePolyDataToObj(shp, objFile, topology)
+
+    def deleteAndUndo():
+        history = ME.DeletionHistory(shp, topology)
+        top = topology.copy()
+        for mask in masks:
+            history.delete(top, mask[:top.n_points])
+        while history.CanUndo:
+            top, _, _ = history.undo()
+        while history.CanRedo:
+            top, _ = history.redo()
+
+    def geodesicBrush():
+        for seedVertex in tree.query(centres[:10])[1]:
+            ME.GeodesicFront(topology.Adjacency, seedVertex, brushRadius).within(brushRadius)
+
+    def loadCached():
+        ME.load3DImage(ME.makeFileDict(workDir, '', 'mesh', '.obj'), cacheDir)
+
+    loadCached() # fill the cache
+    return {'MeshTopology': lambda: ME.MeshTopology(shp),
+            'makeAdjacencyMatrix': lambda: ME.makeAdjacencyMatrix(shp),
+            'minMedEdgeLength': lambda: ME.minMedEdgeLength(shp, topology),
+            'meshRadius': lambda: ME.meshRadius(points),
+            'VertexRGB': lambda: editor.VertexRGB,
+            'brushQuery_x100': lambda: [tree.query_ball_point(c, brushRadius) for c in centres],
+            'geodesicBrush_x10': geodesicBrush,
+            'geodesicDijkstra': lambda: dijkstra(topology.Adjacency, directed=False, indices=0),
+            'deleteUndoRedo_x5': deleteAndUndo,
+            'writePolyDataToObj': lambda: ME.writePolyDataToObj(shp, os.path.join(workDir, 'out.obj'), topology),
+            'load3DImage': lambda: ME.load3DImage(ME.makeFileDict(workDir, '', 'mesh', '.obj')),
+            'load3DImage_cached': loadCached}
+
+
+def makeTree(root, nDirs, filesPerDir):
+    for d in range(nDirs):
+        sub = os.path.join(root, 'd' + str(d // 10), 's' + str(d))
+        os.makedirs(sub)
+        for f in range(filesPerDir):
+            open(os.path.join(sub, 'f' + str(d) + '_' + str(f) + '.obj'), 'w').close()
+
+
+def environment():
+    try:
+        version = metadata.version('MeshEditor')
+    except metadata.PackageNotFoundError:
+        version = None
+    return {'MeshEditor': version,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pyvista': pv.__version__,
+            'vtk': '.'.join(str(x) for x in pv.vtk_version_info),
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Headless benchmarks of MeshEditor')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000, 5000000], help='number of vertices of the synthetic meshes')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--tree', type=int, nargs=2, default=[200, 100], metavar=('DIRS', 'FILES'), help='size of the directory tree for findFiles')
+    parser.add_argument('--only', nargs='+', default=None, help='only run the benchmarks with these names')
+    parser.add_argument('--output', default=None, help='json report (default benchmark_<time>.json in the current directory)')
+    args = parser.parse_args(argv)
+
+    report = {'timestamp': datetime.now(timezone.utc).isoformat(), 'environment': environment(),
+              'settings': vars(args), 'results': []}
+    selected = lambda name: (args.only is None) or (name in args.only)
+    workDir = tempfile.mkdtemp(prefix='MeshEditorBenchmark')
+    try:
+        for n in args.sizes:
+            shp = syntheticMesh(n, args.seed)
+            print('Mesh of ' + str(shp.n_points) + ' vertices and ' + str(shp.n_cells) + ' faces')
+            for name, fn in meshBenchmarks(shp, args.seed, workDir).items():
+                if selected(name):
+                    runs = timeIt(fn, args.repeats)
+                    report['results'].append({'name': name, 'n_points': shp.n_points, 'n_faces': shp.n_cells,
+                                              'seconds': min(runs), 'runs': runs})
+                    print('  ' + name + ': ' + format(min(runs), '.4f') + ' s')
+        if selected('findFiles'):
+            treeDir = os.path.join(workDir, 'tree')
+            makeTree(treeDir, *args.tree)
+            runs = timeIt(lambda: ME.findFiles(treeDir, '.obj', os.path.join(workDir, 'dst'), True, 'edit'), args.repeats)
+            report['results'].append({'name': 'findFiles', 'n_files': args.tree[0] * args.tree[1],
+                                      'seconds': min(runs), 'runs': runs})
+            print('findFiles on ' + str(args.tree[0] * args.tree[1]) + ' files: ' + format(min(runs), '.4f') + ' s')
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    fn = args.output
+    if fn is None:
+        fn = 'benchmark_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.json'
+    with open(fn, 'w') as f:
+        json.dump(report, f, indent=1)
+    print('Report written to ' + fn)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -16,7 +16,7 @@ BME.DestinationPath = dstPath
 BME.InputFileTypes = '.obj'
 BME.Mode = 'landmark'
 BME.Overwrite = True  # if false will only process meshes without an output already in the destination
-BME.PreLoadObjs = False  # optionally all files will be loaded prior to landmarking or cleaning during the call to prepare files
+BME.MeshCacheBudget = 0  # bytes of meshes loaded during the call to prepare files, 0 loads each mesh only when it is needed
 BME.PreserveSubFolders = False
 BME.prepareFiles() # find files to process
 BME.processFiles()
@@ -29,6 +29,6 @@ BME.DestinationPath = dstPath
 BME.InputFileTypes = '.obj'
 BME.Mode = 'edit'
 BME.Overwrite = True  # if false will only process meshes without an output already in the destination
-BME.PreLoadObjs = False  # optionally all files will be loaded prior to landmarking or cleaning during the call to prepare files
+BME.MeshCacheBudget = 0  # bytes of meshes loaded during the call to prepare files, 0 loads each mesh only when it is needed
 BME.prepareFiles() # find files to process
 BME.processFiles()
\ No newline at end of file
@@ -1,13 +1,23 @@
 import os
-import glob
 from itertools import compress
 #from collections import counter
 import pyvista as pv
-from copy import deepcopy
 import numpy as np
 import csv
+import heapq
+import hashlib
+import json
+import tempfile
+import mmap
+import time
+import weakref
+from functools import partial, wraps
+from collections import OrderedDict, deque
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from scipy.sparse import csr_matrix
 from scipy.sparse.csgraph import connected_components,dijkstra
+from scipy.spatial import cKDTree
 
 
 ######## Define Miscellaneous helper functions
@@ -19,35 +29,631 @@ def meshRadius(verts):
     return np.median(N)  #
 
 
-def makeAdjacencyMatrix(polyData):
-    faces = np.reshape(polyData.faces, (int(len(polyData.faces) / 4), 4))
-    faces = faces[:, 1:]
-    edge1 = faces[:,(0,1)]
-    edge2 = faces[:,(1,2)]
-    edge3 = faces[:,(0,2)]
-    edges = np.concatenate((edge1,edge2,edge3),axis=0)
-    edges2 = np.concatenate((edges,edges),axis=0)
-    A = csr_matrix((np.ones(edges2.shape[0]).astype(int),(edges2[:,0],edges2[:,1])),shape=(polyData.n_points,polyData.n_points))
-    return A
+def pointsNearSegment(tree, points, a, b, radius, maxBalls=1000):
+    # indices of the points within radius of the segment from a to b (the capsule swept by a brush moving from a to b)
+    # tree is a cKDTree of points, the capsule is covered by balls spaced radius apart (or by maxBalls further apart balls
+    # if the segment is much longer than radius) which are queried together
+    a = np.asarray(a, dtype=float)
+    ab = np.asarray(b, dtype=float) - a
+    length = np.linalg.norm(ab)
+    n = int(min(np.ceil(length / radius) if radius > 0 else np.inf, maxBalls)) + 1
+    centres = a + np.linspace(0, 1, n)[:, None] * ab
+    step = length / max(n - 1, 1)
+    candidates = tree.query_ball_point(centres, np.sqrt(radius ** 2 + (step / 2) ** 2))
+    inds = np.unique(np.concatenate([np.asarray(c, dtype=int) for c in candidates]))
+    # keep the candidates within radius of their closest point on the segment
+    t = np.clip((points[inds] - a) @ ab / max(length ** 2, np.finfo(float).tiny), 0, 1)
+    d = points[inds] - (a + t[:, None] * ab)
+    return inds[np.einsum('ij,ij->i', d, d) <= radius ** 2]
+
+
+class MeshTopology:
+    # edges and weighted adjacency of a triangle mesh, built once and then updated as vertices are removed
+    def __init__(self, polyData):
+        faces = np.reshape(polyData.faces, (int(len(polyData.faces) / 4), 4))
+        self.Faces = faces[:, 1:]
+        self.n_points = polyData.n_points
+        # deduplicate the edges of the faces - each one is shared by two faces
+        E = np.concatenate((self.Faces[:,(0,1)],self.Faces[:,(1,2)],self.Faces[:,(0,2)]),axis=0)
+        E = np.sort(E,axis=1).astype(np.int64)
+        keys, inv = np.unique(E[:,0]*self.n_points+E[:,1], return_inverse=True)
+        self.Edges = np.stack((keys // self.n_points, keys % self.n_points), axis=1)
+        self.FaceEdges = np.reshape(inv, (3, self.Faces.shape[0])).T # index into Edges of each edge of each face
+        verts = np.asarray(polyData.points)
+        self.EdgeLengths = np.linalg.norm(verts[self.Edges[:,0],:]-verts[self.Edges[:,1],:],axis=1)
+        self._buildAdjacency()
+
+    def _buildAdjacency(self):
+        # symmetric, with each edge weighted by its length
+        rows = np.concatenate((self.Edges[:,0],self.Edges[:,1]))
+        cols = np.concatenate((self.Edges[:,1],self.Edges[:,0]))
+        L = np.concatenate((self.EdgeLengths,self.EdgeLengths))
+        self.Adjacency = csr_matrix((L,(rows,cols)),shape=(self.n_points,self.n_points))
+        self.Degree = np.diff(self.Adjacency.indptr)
+
+    def copy(self):
+        # shallow copy - the arrays are replaced rather than modified when vertices are removed so they can be shared
+        out = MeshTopology.__new__(MeshTopology)
+        out.__dict__.update(self.__dict__)
+        return out
+
+    def removeVertices(self, mask):
+        # remove the vertices flagged in mask, together with any face using them and any vertex or edge left without a face
+        # matches pyvista's PolyData.remove_points, returns the indices of the kept vertices and a mask of the kept faces
+        keptFaces = np.any(mask[self.Faces],axis=1) == False
+        return self.keepFaces(keptFaces), keptFaces
+
+    def keepFaces(self, keptFaces):
+        # keep only the faces flagged in keptFaces and the vertices and edges they use, returns the indices of the kept vertices
+        used = np.zeros(self.n_points,dtype=bool)
+        used[self.Faces[keptFaces]] = True
+        keptVertices = np.flatnonzero(used)
+        usedEdges = np.zeros(self.Edges.shape[0],dtype=bool)
+        usedEdges[self.FaceEdges[keptFaces]] = True
+        # re-index - the lookups are monotonic so the edges stay sorted
+        lookup = np.full(self.n_points,-1)
+        lookup[keptVertices] = np.arange(len(keptVertices))
+        edgeLookup = np.full(self.Edges.shape[0],-1)
+        edgeLookup[usedEdges] = np.arange(np.sum(usedEdges))
+        self.Faces = lookup[self.Faces[keptFaces]]
+        self.FaceEdges = edgeLookup[self.FaceEdges[keptFaces]]
+        self.Edges = lookup[self.Edges[usedEdges]]
+        self.EdgeLengths = self.EdgeLengths[usedEdges]
+        self.n_points = len(keptVertices)
+        self._buildAdjacency()
+        return keptVertices
+
+
+def makeTriangleMesh(points, faces, pointData=None):
+    # polydata from an n x 3 array of points and an m x 3 array of triangles, with optional point arrays
+    F = np.concatenate((np.full([faces.shape[0],1],3),faces),axis=1)
+    out = pv.PolyData(points, F.ravel())
+    if pointData is not None:
+        for name, arr in pointData.items():
+            out.point_data[name] = arr
+    return out
+
+
+def removeVertices(polyData, mask, topology=None):
+    # copy of a triangle mesh without the vertices flagged in mask, like PolyData.remove_points
+    # returns the new mesh and the indices of the kept vertices
+    if topology is None:
+        topology = MeshTopology(polyData)
+    else:
+        topology = topology.copy() # so that the topology passed in is left alone
+    keptVertices,_ = topology.removeVertices(mask)
+    pointData = {name: polyData.point_data[name][keptVertices] for name in polyData.point_data.keys()}
+    return makeTriangleMesh(np.asarray(polyData.points)[keptVertices], topology.Faces, pointData), keptVertices
+
+
+class DeletionHistory:
+    # vertex deletions recorded as masks of the faces of the original mesh that are kept after each deletion
+    # any step can be rebuilt straight from the original arrays so undo and redo never replay earlier deletions
+    # the original arrays are referenced, not copied - the edited mesh gets new arrays when vertices are deleted
+    # of the original topology only the faces and edges are kept, with the indices as int32
+    # the edge lengths and adjacency are rebuilt from them and the original points when a step is restored
+    def __init__(self, polyData, topology):
+        self._Points = polyData.points
+        self._PointData = {name: polyData.point_data[name] for name in polyData.point_data.keys()}
+        self._Topology = {'n_points': topology.n_points, 'Faces': topology.Faces.astype(np.int32),
+                          'FaceEdges': topology.FaceEdges.astype(np.int32), 'Edges': topology.Edges.astype(np.int32)}
+        self._NFaces = topology.Faces.shape[0]
+        self._States = [None] # packed mask of the kept faces after each deletion, None is the original mesh
+        self._Selections = [] # packed mask of the vertices deleted by each deletion, relative to the step before it
+        self.Current = 0 # index into _States of the state being shown
+        self.KeptVertices = np.arange(polyData.n_points) # indices of the current vertices in the original mesh
+        self.KeptFaces = np.arange(self._NFaces) # indices of the current faces in the original mesh
+
+    @property
+    def CanUndo(self):
+        return self.Current > 0
+
+    @property
+    def CanRedo(self):
+        return self.Current < len(self._States)-1
+
+    def delete(self, topology, mask):
+        # delete the vertices flagged in mask, updating topology in place, returns the resulting mesh
+        keptVertices, keptFaces = topology.removeVertices(mask)
+        self.KeptVertices = self.KeptVertices[keptVertices]
+        self.KeptFaces = self.KeptFaces[keptFaces]
+        # a new deletion discards anything that could have been redone
+        del self._States[self.Current+1:]
+        del self._Selections[self.Current:]
+        faceMask = np.zeros(self._NFaces,dtype=bool)
+        faceMask[self.KeptFaces] = True
+        self._States.append(np.packbits(faceMask))
+        self._Selections.append(np.packbits(mask))
+        self.Current += 1
+        return self.makeMesh(topology)
+
+    def undo(self):
+        # step back one deletion, returns the topology and mesh of that step and the selection that had been deleted
+        topology = self._restore(self.Current-1)
+        selection = np.unpackbits(self._Selections[self.Current],count=topology.n_points).astype(bool)
+        return topology, self.makeMesh(topology), selection
+
+    def redo(self):
+        # repeat the last undone deletion, returns the topology and mesh of that step
+        topology = self._restore(self.Current+1)
+        return topology, self.makeMesh(topology)
+
+    def _restore(self, step):
+        self.Current = step
+        topology = MeshTopology.__new__(MeshTopology)
+        topology.__dict__.update(self._Topology)
+        verts = np.asarray(self._Points)
+        topology.EdgeLengths = np.linalg.norm(verts[topology.Edges[:,0],:]-verts[topology.Edges[:,1],:],axis=1)
+        if self._States[step] is None:
+            for name in ['Faces', 'FaceEdges', 'Edges']:
+                setattr(topology, name, getattr(topology, name).astype(np.int64))
+            topology._buildAdjacency()
+            self.KeptVertices = np.arange(topology.n_points)
+            self.KeptFaces = np.arange(self._NFaces)
+        else:
+            faceMask = np.unpackbits(self._States[step],count=self._NFaces).astype(bool)
+            self.KeptVertices = topology.keepFaces(faceMask)
+            self.KeptFaces = np.flatnonzero(faceMask)
+        return topology
+
+    def makeMesh(self, topology):
+        # mesh of the current step, with the point data of the original mesh
+        pointData = {name: arr[self.KeptVertices] for name, arr in self._PointData.items()}
+        return makeTriangleMesh(self._Points[self.KeptVertices], topology.Faces, pointData)
+
+
+class SessionLog:
+    # append-only record of the edits made in a MeshEditor, in a memory mapped file next to the output, so that a session can be resumed after a crash
+    # each record is a kind, the length of its payload and the payload, and the header holds the length of the records that are complete
+    # records are copied into the mapping rather than written to the file so appending one costs microseconds, and the operating system
+    # keeps them even if the process dies
+    # the header also identifies the mesh the log belongs to (number of points and faces and the sum of the points) so a log is never
+    # replayed onto a different mesh
+    Magic = b'MESHLOG1'
+    HeaderBytes = 64
+    # kinds of record
+    Delete = 1 # packed mask of the vertices deleted
+    Undo = 2
+    Redo = 3
+    ToggleSelection = 4 # indices (int64) of the vertices whose selection changed
+    AddLandmark = 5 # position (3), barycentric coordinates (3) and triangle (as a float) of the landmark
+    DeleteLandmark = 6
+
+    def __init__(self, fn, mesh):
+        self.FileName = fn
+        self._Id = np.array([mesh.n_points, mesh.n_cells], dtype=np.int64).tobytes() + np.float64(np.sum(mesh.points, dtype=np.float64)).tobytes()
+        resume = False
+        if os.path.isfile(fn) and (os.path.getsize(fn) >= self.HeaderBytes):
+            with open(fn, 'rb') as f:
+                header = f.read(self.HeaderBytes)
+            resume = (header[:8] == self.Magic) & (header[16:40] == self._Id)
+        if resume:
+            self._File = open(fn, 'r+b')
+        else:
+            self._File = open(fn, 'w+b')
+            self._File.truncate(2**16)
+        self._Map = mmap.mmap(self._File.fileno(), 0)
+        if resume == False:
+            self._Map[:40] = self.Magic + np.uint64(self.HeaderBytes).tobytes() + self._Id
+        self._End = int(np.frombuffer(self._Map, dtype=np.uint64, count=1, offset=8)[0])
+
+    def __len__(self):
+        return self._End - self.HeaderBytes # bytes of records
+
+    def append(self, kind, payload=b''):
+        n = len(payload)
+        size = 16 + (-(-n // 8)) * 8 # records are 8 byte aligned
+        if self._End + size > len(self._Map):
+            self._grow(self._End + size)
+        self._Map[self._End:self._End + 16] = np.array([kind, n], dtype=np.uint64).tobytes()
+        self._Map[self._End + 16:self._End + 16 + n] = payload
+        self._End += size
+        self._Map[8:16] = np.uint64(self._End).tobytes() # the record only counts once this is written
+
+    def _grow(self, minSize):
+        size = len(self._Map)
+        while size < minSize:
+            size *= 2
+        self._Map.close()
+        self._File.truncate(size)
+        self._Map = mmap.mmap(self._File.fileno(), 0)
+
+    def records(self):
+        # (kind, payload bytes) of each complete record, in order
+        out = []
+        i = self.HeaderBytes
+        while i < self._End:
+            kind, n = np.frombuffer(self._Map, dtype=np.uint64, count=2, offset=i)
+            out.append((int(kind), bytes(self._Map[i + 16:i + 16 + int(n)])))
+            i += 16 + (-(-int(n) // 8)) * 8
+        return out
+
+    def close(self):
+        if self._Map is not None:
+            self._Map.close()
+            self._File.close()
+            self._Map = None
+
+    def delete(self):
+        self.close()
+        os.remove(self.FileName)
+
+
+def triangleAreas(points, faces):
+    # area of each triangle of an m x 3 array of triangles
+    e1 = points[faces[:,1]] - points[faces[:,0]]
+    e2 = points[faces[:,2]] - points[faces[:,0]]
+    return np.linalg.norm(np.cross(e1, e2), axis=1) / 2
+
+def meshArea(points, faces):
+    # total area of an m x 3 array of triangles
+    return np.sum(triangleAreas(points, faces))
+
+
+class DisplayProxy:
+    # coarse copy of a large triangle mesh for display, made by clustering the vertices on a regular grid
+    # every vertex of the full mesh belongs to exactly one proxy vertex (FullToProxy) so the full mesh can be edited while the proxy is shown
+    # the clusters are fixed on the original mesh so the proxy of any later state (after deletions, undo or redo) is rebuilt cheaply from them
+    def __init__(self, polyData, targetFaces, topology=None):
+        if topology is None:
+            topology = MeshTopology(polyData)
+        points = np.asarray(polyData.points)
+        # roughly two triangles per occupied grid cell on the surface
+        self.CellSize = np.sqrt(2 * meshArea(points, topology.Faces) / targetFaces)
+        cells = np.floor((points - points.min(axis=0)) / self.CellSize).astype(np.int64)
+        nCells = cells.max(axis=0) + 1
+        _, self._OriginalLabels = np.unique((cells[:,0] * nCells[1] + cells[:,1]) * nCells[2] + cells[:,2], return_inverse=True)
+        self.Mesh = None
+        self.update(points, topology.Faces, np.arange(polyData.n_points))
+
+    def update(self, points, faces, keptVertices):
+        # rebuild the proxy of the mesh with these points and faces, whose vertices are keptVertices of the original mesh
+        # the proxy mesh is updated in place so the actor showing it doesn't need rebuilding
+        uniqueLabels, labels = np.unique(self._OriginalLabels[keptVertices], return_inverse=True)
+        nProxy = len(uniqueLabels)
+        self.FullToProxy = labels
+        self.Counts = np.bincount(labels, minlength=nProxy)
+        proxyPoints = np.stack([np.bincount(labels, weights=points[:,d], minlength=nProxy) for d in range(3)], axis=1) / self.Counts[:,None]
+        # triangles of the full mesh with their corners in three different clusters, each kept once
+        F = labels[faces]
+        F = F[(F[:,0] != F[:,1]) & (F[:,1] != F[:,2]) & (F[:,0] != F[:,2])]
+        sortedF = np.sort(F, axis=1).astype(np.int64)
+        if nProxy < 2**21: # one integer per triangle
+            _, first = np.unique((sortedF[:,0] * nProxy + sortedF[:,1]) * nProxy + sortedF[:,2], return_index=True)
+        else:
+            _, first = np.unique(sortedF, axis=0, return_index=True)
+        mesh = makeTriangleMesh(proxyPoints, F[np.sort(first)])
+        if self.Mesh is None:
+            self.Mesh = mesh
+        else:
+            self.Mesh.copy_from(mesh, deep=False)
+        # the full mesh vertices of each proxy vertex, stored contiguously
+        self._Order = np.argsort(labels, kind='stable')
+        self._Starts = np.concatenate(([0], np.cumsum(self.Counts)[:-1]))
+
+    def proxiesOf(self, fullInds):
+        # proxy vertices of the given full mesh vertices
+        return np.unique(self.FullToProxy[fullInds])
+
+    def members(self, proxyInds):
+        # full mesh vertices of the given proxy vertices and, for each, its position in proxyInds
+        counts = self.Counts[proxyInds]
+        group = np.repeat(np.arange(len(proxyInds)), counts)
+        offsets = np.arange(len(group)) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self._Order[self._Starts[proxyInds][group] + offsets], group
+
+
+def makeAdjacencyMatrix(polyData, topology=None):
+    # one entry per edge in each direction weighted by the length of the edge
+    if topology is None:
+        topology = MeshTopology(polyData)
+    return topology.Adjacency
+
+class GeodesicFront:
+    # geodesic distances from a seed vertex up to a radius
+    # the first radius is found with scipy's dijkstra, which is fast enough to run each time the brush moves to a new seed
+    # a larger radius around the same seed continues a dijkstra from the frontier of the settled vertices rather than starting again
+    def __init__(self, A, seed, radius=0.):
+        self.Seed = seed
+        self.Radius = radius
+        self._indptr = A.indptr
+        self._indices = A.indices
+        self._weights = A.data
+        self._A = A
+        D = dijkstra(A, indices=seed, limit=radius) # A is symmetric so it needn't be treated as undirected
+        self._Inds = np.flatnonzero(np.isfinite(D))
+        self._D = D[self._Inds]
+        self._Heap = None # frontier, only built if the radius grows
+
+    def _buildFrontier(self):
+        # settled vertices and the tentative distances of their unsettled neighbours, for expandTo
+        settledMask = np.zeros(self._A.shape[0], dtype=bool)
+        settledMask[self._Inds] = True
+        edges = self._A[self._Inds].tocoo()
+        nd = self._D[edges.row] + edges.data
+        keep = settledMask[edges.col] == False
+        v, nd = edges.col[keep], nd[keep]
+        order = np.lexsort((nd, v))
+        first = order[np.concatenate(([True], v[order][1:] != v[order][:-1]))] # shortest tentative distance of each neighbour
+        self._Settled = dict(zip(self._Inds.tolist(), self._D.tolist())) # vertex: geodesic distance from the seed
+        self._Tentative = dict(zip(v[first].tolist(), nd[first].tolist()))
+        self._Heap = list(zip(nd[first].tolist(), v[first].tolist()))
+        heapq.heapify(self._Heap)
+
+    def expandTo(self, radius):
+        # settle every vertex with a geodesic distance up to radius
+        if self._Heap is None:
+            self._buildFrontier()
+        heap = self._Heap
+        settled = self._Settled
+        tentative = self._Tentative
+        indptr = self._indptr
+        while len(heap) > 0 and heap[0][0] <= radius:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled[u] = d
+            s, e = indptr[u], indptr[u + 1]
+            for v, w in zip(self._indices[s:e].tolist(), self._weights[s:e].tolist()):
+                nd = d + w
+                if (v not in settled) and (nd < tentative.get(v, np.inf)):
+                    tentative[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        self.Radius = max(self.Radius, radius)
+
+    def within(self, radius):
+        # indices and geodesic distances of the vertices within radius of the seed
+        if radius > self.Radius:
+            self.expandTo(radius)
+        if self._Heap is None:
+            inds, D = self._Inds, self._D
+        else:
+            inds = np.fromiter(self._Settled.keys(), dtype=int, count=len(self._Settled))
+            D = np.fromiter(self._Settled.values(), dtype=float, count=len(self._Settled))
+        keep = D < radius
+        return inds[keep], D[keep]
+
 
-def labelConnectedComponents(polyData):
-    A = makeAdjacencyMatrix(polyData)
+def labelConnectedComponents(polyData, topology=None):
+    A = makeAdjacencyMatrix(polyData, topology)
     _,L = connected_components(A,directed=False)
     return L
 
-def minMedEdgeLength(polyData):
-    verts = polyData.points
-    faces = np.reshape(polyData.faces, (int(len(polyData.faces) / 4), 4))
-    faces = faces[:,1:]
-    v0 = faces[:,0]
-    v1 = faces[:,1]
-    v2 = faces[:,2]
-    e0 = verts[v0,:]-verts[v1,:]
-    e1 = verts[v1,:]-verts[v2,:]
-    e2 = verts[v2,:]-verts[v0,:]
-    E = np.concatenate((e0,e1,e2),axis = 0)
-    N = np.linalg.norm(E,axis=1)
+def componentSizes(polyData, topology=None):
+    # label of the connected component of each vertex and the number of vertices and surface area of each component
+    if topology is None:
+        topology = MeshTopology(polyData)
+    L = labelConnectedComponents(polyData, topology)
+    nVertices = np.bincount(L)
+    # every vertex of a triangle is in the same component
+    areas = np.bincount(L[topology.Faces[:,0]], weights=triangleAreas(np.asarray(polyData.points), topology.Faces), minlength=len(nVertices))
+    return L, nVertices, areas
+
+def smallComponentMask(polyData, topology=None, minVertices=None, minArea=None, keepLargest=False):
+    # vertices of the connected components with fewer than minVertices vertices or less than minArea surface area
+    # or, if keepLargest is True, of every component except the one with the most vertices
+    L, nVertices, areas = componentSizes(polyData, topology)
+    remove = np.zeros(len(nVertices), dtype=bool)
+    if keepLargest:
+        remove[:] = True
+        remove[np.argmax(nVertices)] = False
+    if minVertices is not None:
+        remove |= nVertices < minVertices
+    if minArea is not None:
+        remove |= areas < minArea
+    return remove[L]
+
+def minMedEdgeLength(polyData, topology=None):
+    if topology is None:
+        topology = MeshTopology(polyData)
+    N = topology.EdgeLengths
     return np.min(N), np.median(N)
+def closestPointsOnTriangles(p, a, b, c):
+    # closest point to each row of p on the triangle with corners in the same rows of a, b and c, and its barycentric coordinates
+    # follows Ericson, Real-Time Collision Detection 5.1.5, with every voronoi region of the triangle handled as a mask
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    bp = p - b
+    cp = p - c
+    dot = lambda x, y: np.einsum('ij,ij->i', x, y)
+    d1, d2 = dot(ab, ap), dot(ac, ap)
+    d3, d4 = dot(ab, bp), dot(ac, bp)
+    d5, d6 = dot(ab, cp), dot(ac, cp)
+    va = d3*d6 - d5*d4
+    vb = d5*d2 - d1*d6
+    vc = d1*d4 - d3*d2
+    bary = np.empty((p.shape[0], 3))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # interior, then each region in reverse order of precedence so that the first region that applies wins
+        denom = va + vb + vc
+        bary[:,1] = vb / denom
+        bary[:,2] = vc / denom
+        bary[:,0] = 1 - bary[:,1] - bary[:,2]
+        regions = [((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0), 1, 2, (d4 - d3) / ((d4 - d3) + (d5 - d6))), # edge bc
+                   ((vb <= 0) & (d2 >= 0) & (d6 <= 0), 0, 2, d2 / (d2 - d6)), # edge ac
+                   ((d6 >= 0) & (d5 <= d6), 0, 2, np.ones(len(p))), # corner c
+                   ((vc <= 0) & (d1 >= 0) & (d3 <= 0), 0, 1, d1 / (d1 - d3)), # edge ab
+                   ((d3 >= 0) & (d4 <= d3), 0, 1, np.ones(len(p))), # corner b
+                   ((d1 <= 0) & (d2 <= 0), 0, 1, np.zeros(len(p)))] # corner a
+    for mask, i, j, t in regions:
+        bary[mask] = 0
+        bary[mask, i] = 1 - t[mask]
+        bary[mask, j] = t[mask]
+    bary[~np.isfinite(bary).all(axis=1)] = [1, 0, 0] # degenerate triangles
+    points = bary[:,[0]]*a + bary[:,[1]]*b + bary[:,[2]]*c
+    return points, bary
+
+
+class TriangleLocator:
+    # finds the closest point on the surface of a triangle mesh, or where a ray first hits it, using kd-trees of the triangle centroids
+    # a triangle can only be closer than distance d if its centroid is within d + its radius (the largest distance from its centroid to a corner)
+    # the triangles are put in buckets of radii within a factor of two, with a tree for each, so that a few large triangles
+    # (e.g. slivers filling a hole) only widen the search among themselves
+    def __init__(self, polyData, faces=None):
+        if faces is None:
+            if polyData.is_all_triangles == False:
+                polyData = polyData.triangulate()
+            faces = np.reshape(polyData.faces, (-1, 4))[:, 1:]
+        self.Points = np.asarray(polyData.points)
+        self.Faces = faces
+        corners = self.Points[faces] # m x 3 corners x 3
+        centroids = corners.mean(axis=1)
+        radii = np.max(np.linalg.norm(corners - centroids[:,None,:], axis=2), axis=1)
+        self.Radius = np.max(radii)
+        self.Bounds = (corners.min(axis=(0, 1)), corners.max(axis=(0, 1)))
+        with np.errstate(divide='ignore'):
+            bucket = np.ceil(np.log2(np.maximum(radii / max(self.Radius, np.finfo(float).tiny), 2.**-30)))
+        self._Buckets = [] # (indices of the triangles, kd-tree of their centroids, largest radius)
+        for b in np.unique(bucket):
+            inds = np.flatnonzero(bucket == b)
+            self._Buckets.append((inds, cKDTree(centroids[inds]), np.max(radii[inds])))
+
+    def _closest(self, p, faces):
+        corners = self.Points[self.Faces[faces]]
+        return closestPointsOnTriangles(p, corners[:,0], corners[:,1], corners[:,2])
+
+    def closestPoints(self, points):
+        # closest surface point to each row of points, with the index of the triangle it lies on, its barycentric coordinates and its distance
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        # the triangles with the nearest centroid in each bucket bound the search for each point
+        bound = np.full(len(points), np.inf)
+        for inds, tree, _ in self._Buckets:
+            cp, _ = self._closest(points, inds[tree.query(points)[1]])
+            bound = np.minimum(bound, np.linalg.norm(cp - points, axis=1))
+        pointInds = []
+        faceInds = []
+        for inds, tree, radius in self._Buckets:
+            candidates = tree.query_ball_point(points, bound + radius)
+            counts = np.array([len(x) for x in candidates])
+            pointInds.append(np.repeat(np.arange(len(points)), counts))
+            faceInds.append(inds[np.concatenate(candidates).astype(int)])
+        pointInds = np.concatenate(pointInds)
+        faceInds = np.concatenate(faceInds)
+        counts = np.bincount(pointInds, minlength=len(points))
+        cp, bary = self._closest(points[pointInds], faceInds)
+        dist = np.linalg.norm(cp - points[pointInds], axis=1)
+        # nearest candidate of each point
+        order = np.lexsort((dist, pointInds))
+        best = order[np.concatenate(([0], np.cumsum(counts)[:-1]))]
+        return cp[best], faceInds[best], bary[best], dist[best]
+
+    def closestPoint(self, point):
+        # closest surface point to a single point, with its triangle, barycentric coordinates and distance
+        cp, face, bary, dist = self.closestPoints(point)
+        return cp[0], face[0], bary[0], dist[0]
+
+    def intersectRay(self, origin, direction):
+        # first point where the ray from origin along direction hits the surface, with its triangle and barycentric coordinates
+        # or None if it misses. The ray is clipped to the bounding box, where any hit must be, and only triangles with a centroid
+        # within their radius of it are tested
+        origin = np.asarray(origin, dtype=float)
+        direction = np.asarray(direction, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t0 = (self.Bounds[0] - origin) / direction
+            t1 = (self.Bounds[1] - origin) / direction
+        inside = (origin >= self.Bounds[0]) & (origin <= self.Bounds[1])
+        t0 = np.where(direction == 0, np.where(inside, -np.inf, np.inf), t0) # parallel to a slab
+        t1 = np.where(direction == 0, np.where(inside, np.inf, -np.inf), t1)
+        tNear = max(np.max(np.minimum(t0, t1)), 0)
+        tFar = np.min(np.maximum(t0, t1))
+        if tNear > tFar:
+            return None
+        a, b = origin + tNear * direction, origin + tFar * direction
+        faces = np.concatenate([inds[pointsNearSegment(tree, tree.data, a, b, radius)] for inds, tree, radius in self._Buckets])
+        if len(faces) == 0:
+            return None
+        # Moller-Trumbore, from either side of each triangle
+        corners = self.Points[self.Faces[faces]]
+        e1 = corners[:,1] - corners[:,0]
+        e2 = corners[:,2] - corners[:,0]
+        pvec = np.cross(direction, e2)
+        det = np.einsum('ij,ij->i', e1, pvec)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            inv = 1 / det
+            tv = origin - corners[:,0]
+            u = np.einsum('ij,ij->i', tv, pvec) * inv
+            qv = np.cross(tv, e1)
+            v = (qv @ direction) * inv
+            t = np.einsum('ij,ij->i', e2, qv) * inv
+            hit = (det != 0) & (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+        if hit.any() == False:
+            return None
+        i = np.flatnonzero(hit)[np.argmin(t[hit])]
+        return origin + t[i] * direction, faces[i], np.array([1 - u[i] - v[i], u[i], v[i]])
+
+    def pointsFromBarycentric(self, faces, bary):
+        # positions of points given as triangle indices and barycentric coordinates
+        return np.einsum('ij,ijk->ik', bary, self.Points[self.Faces[faces]])
+
+
+def projectLandmarks(polyData, landmarks, locator=None):
+    # projects an n x 3 array of (template) landmarks onto the surface of a mesh in one call
+    # returns the projected points, the triangle each lies on and its barycentric coordinates
+    if locator is None:
+        locator = TriangleLocator(polyData)
+    points, faces, bary, _ = locator.closestPoints(landmarks)
+    return points, faces, bary
+
+
+class GrowableArray:
+    # array that rows can be appended to and removed from the end of, in a buffer that doubles in size when it is full
+    def __init__(self, rowShape=(), dtype=float, capacity=16):
+        self._Buffer = np.zeros((capacity,) + tuple(rowShape), dtype=dtype)
+        self._N = 0
+
+    def __len__(self):
+        return self._N
+
+    @property
+    def Array(self): # view of the rows in use
+        return self._Buffer[:self._N]
+
+    def append(self, row):
+        if self._N == self._Buffer.shape[0]:
+            grown = np.zeros((2 * self._N,) + self._Buffer.shape[1:], dtype=self._Buffer.dtype)
+            grown[:self._N] = self._Buffer
+            self._Buffer = grown
+        self._Buffer[self._N] = row
+        self._N += 1
+
+    def pop(self):
+        self._N -= 1
+        return self._Buffer[self._N].copy()
+
+
+class LandmarkCloud:
+    # landmarks drawn as a single point cloud of sphere splats whose points are a view of a GrowableArray
+    # adding or removing a landmark only touches that buffer, so the cost of rendering doesn't grow with one actor per landmark
+    def __init__(self, plotter, radius, color='r'):
+        self.Points = GrowableArray((3,))
+        self.Mesh = pv.PolyData()
+        self.Actor = None
+        self._Plotter = plotter
+        self._Radius = radius
+        self._Color = color
+
+    def __len__(self):
+        return len(self.Points)
+
+    def append(self, point):
+        self.Points.append(point)
+        self._update()
+
+    def pop(self):
+        point = self.Points.pop()
+        self._update()
+        return point
+
+    def _update(self):
+        self.Mesh.copy_from(pv.PolyData(self.Points.Array), deep=False) # wraps the buffer without copying it
+        if (self.Actor is None) & (len(self.Points) > 0): # pyvista refuses to add an empty mesh
+            self.Actor = self._Plotter.add_mesh(self.Mesh, style='points_gaussian', render_points_as_spheres=True,
+                                                color=self._Color, pickable=False)
+            self.Actor.mapper.scale_factor = self._Radius
+        self._Plotter.render()
+
+
 def uniqueIndexes(l):
     seen = set()
     res = []
@@ -70,6 +676,142 @@ def makeFileDict(head, subpath, fn, ext):
     return out
 
 
+class FileTable:
+    # columnar table of files, used by the batch classes in place of a list of dictionaries made by makeFileDict
+    # the folders and extensions are interned, the file names are packed into a single string
+    # and loaded meshes are kept apart in Meshes (row: polydata) so they can be released without touching the table
+    # indexing a row returns a FileRecord which can be used like one of those dictionaries
+    Columns = ('superPath', 'subPath', 'ext')
+
+    def __init__(self, superPaths=(), subPaths=(), fileNames=(), exts=()):
+        self._Pools = dict()
+        self._Codes = dict()
+        for name, values in zip(self.Columns, (superPaths, subPaths, exts)):
+            self._Pools[name], self._Codes[name] = self._intern(values)
+        self._setNames(fileNames)
+        self.Meshes = dict()
+
+    @staticmethod
+    def _intern(values):
+        pool = []
+        index = dict()
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, v in enumerate(values):
+            if v not in index:
+                index[v] = len(pool)
+                pool.append(v)
+            codes[i] = index[v]
+        return pool, codes
+
+    def _setNames(self, fileNames):
+        self._Names = ''.join(fileNames)
+        self._NameEnds = np.cumsum([len(x) for x in fileNames], dtype=np.int64)
+
+    def __len__(self):
+        return len(self._NameEnds)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.subset(np.arange(len(self))[i])
+        if i < 0:
+            i = i + len(self)
+        if (i < 0) | (i >= len(self)):
+            raise IndexError('FileTable index out of range')
+        return FileRecord(self, i)
+
+    def __iter__(self):
+        return (FileRecord(self, i) for i in range(len(self)))
+
+    def get(self, row, key):
+        if key == 'fileName':
+            start = 0 if row == 0 else self._NameEnds[row - 1]
+            return self._Names[start:self._NameEnds[row]]
+        elif key == 'polydata':
+            return self.Meshes.get(row)
+        else:
+            return self._Pools[key][self._Codes[key][row]]
+
+    def set(self, row, key, value):
+        # only the loaded mesh can be changed
+        if key != 'polydata':
+            raise KeyError('Only polydata can be set in a FileTable')
+        if value is None:
+            self.Meshes.pop(row, None)
+        else:
+            self.Meshes[row] = value
+
+    def fileNames(self):
+        return [self.get(i, 'fileName') for i in range(len(self))]
+
+    def subset(self, rows):
+        # table of the rows given by an array of indices, loaded meshes are carried over
+        rows = np.asarray(rows, dtype=int)
+        out = FileTable.__new__(FileTable)
+        out._Pools = self._Pools
+        out._Codes = {name: codes[rows] for name, codes in self._Codes.items()}
+        out._setNames([self.get(i, 'fileName') for i in rows])
+        out.Meshes = {j: self.Meshes[i] for j, i in enumerate(rows) if i in self.Meshes}
+        return out
+
+    def withPaths(self, superPath=None, subPath=None, ext=None):
+        # table of the same files in another folder and/or with another extension, without any loaded meshes
+        # the file names are shared rather than copied
+        out = FileTable.__new__(FileTable)
+        out._Pools = dict(self._Pools)
+        out._Codes = dict(self._Codes)
+        for name, value in zip(self.Columns, (superPath, subPath, ext)):
+            if value is not None:
+                out._Pools[name] = [value]
+                out._Codes[name] = np.zeros(len(self), dtype=np.int32)
+        out._Names = self._Names
+        out._NameEnds = self._NameEnds
+        out.Meshes = dict()
+        return out
+
+
+class FileRecord:
+    # one row of a FileTable, read (and polydata set) like a dictionary made by makeFileDict
+    __slots__ = ('_Table', '_Row')
+    Keys = ('superPath', 'subPath', 'fileName', 'ext', 'polydata')
+
+    def __init__(self, table, row):
+        self._Table = table
+        self._Row = row
+
+    def __getitem__(self, key):
+        return self._Table.get(self._Row, key)
+
+    def __setitem__(self, key, value):
+        self._Table.set(self._Row, key, value)
+
+    def update(self, values):
+        for key, value in values.items():
+            self[key] = value
+
+    def keys(self):
+        return self.Keys
+
+    def toDict(self, withMesh=True):
+        out = makeFileDict(self['superPath'], self['subPath'], self['fileName'], self['ext'])
+        if withMesh:
+            out['polydata'] = self['polydata']
+        return out
+
+    def __reduce__(self):
+        # sent to other processes as a plain dictionary without the mesh rather than with the whole table
+        return (dict, (self.toDict(withMesh=False),))
+
+    def __repr__(self):
+        return 'FileRecord(' + repr(self.toDict(withMesh=False)) + ')'
+
+
+def selectFiles(files, keep):
+    # the files (a FileTable or a list of file dictionaries) flagged in keep
+    if isinstance(files, FileTable):
+        return files.subset(np.flatnonzero(keep))
+    return [x for x in compress(files, keep)]
+
+
 def dictToPath(fileDict):
     # extracts path information (represented in a dictionary) and composes a full file path
     return os.path.join(fileDict['superPath'], fileDict['subPath'], fileDict['fileName'] + fileDict['ext'])
@@ -91,24 +833,81 @@ def removeLeadingPathSeparator(x):
         return x
 
 
-def findFiles(sourcePath, filetype, destination, preserveSubFolders, mode):
+class FileManifest:
+    # record of the (non hidden) files below a directory - the names of the files and sub directories of each directory
+    # saved as json so that later scans only list the directories whose modification time has changed
+    # (a directory's modification time changes when files are added, removed or renamed in it, but not when a file is edited in place)
+    # a listing is only reused if the directory's modification time was clearly older than the scan that made it,
+    # otherwise a change in the same timestamp tick (coarse on FAT/SMB shares) would go unnoticed - as in git's racy check
+    RacyMargin = 2 * 10**9 # ns
+
+    def __init__(self, sourcePath, fn=None):
+        self.SourcePath = sourcePath
+        self.FileName = fn
+        self._Dirs = dict() # sub path: {'mtime':, 'scanned':, 'subdirs': [names], 'files': [names]}
+        if (fn is not None) and os.path.isfile(fn):
+            with open(fn, 'r') as f:
+                saved = json.load(f)
+            if saved.get('sourcePath') == sourcePath:
+                self._Dirs = saved['dirs']
+
+    def scan(self):
+        # returns (sub path, file name) of every file, sorted
+        oldDirs = self._Dirs
+        self._Dirs = dict()
+        out = []
+        stack = ['']
+        while len(stack) > 0:
+            subPath = stack.pop()
+            try:
+                mtime = os.stat(os.path.join(self.SourcePath, subPath)).st_mtime_ns
+            except OSError:
+                continue
+            entry = oldDirs.get(subPath)
+            if (entry is None) or (entry['mtime'] != mtime) or (entry.get('scanned', mtime) - mtime < self.RacyMargin):
+                entry = self._listDirectory(subPath, mtime)
+            self._Dirs[subPath] = entry
+            stack.extend(os.path.join(subPath, d) for d in entry['subdirs'])
+            out.extend((subPath, name) for name in entry['files'])
+        out.sort()
+        return out
+
+    def _listDirectory(self, subPath, mtime):
+        entry = {'mtime': mtime, 'scanned': time.time_ns(), 'subdirs': [], 'files': []}
+        with os.scandir(os.path.join(self.SourcePath, subPath)) as it:
+            for e in it:
+                if e.name[0] == '.':  # hidden
+                    continue
+                if e.is_dir():
+                    entry['subdirs'].append(e.name)
+                elif e.is_file():
+                    entry['files'].append(e.name)
+        return entry
+
+    def save(self):
+        if self.FileName is None:
+            return
+        tmp = self.FileName + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'sourcePath': self.SourcePath, 'dirs': self._Dirs}, f)
+        os.replace(tmp, self.FileName)
+
+
+def findFiles(sourcePath, filetype, destination, preserveSubFolders, mode, manifest=None, outputExt=None):
     # prepare initial list of input and output files
     # returns a dictionary for each file in a list
+    # if a FileManifest of sourcePath is given it is used (and updated) to find the files
+    # outputExt overrides the extension of the output files implied by mode
 
     # find files matching file type
-    inList = glob.glob(os.path.join(sourcePath, '**', '*' + filetype), recursive=True)  # recursive serach for files
+    if manifest is None:
+        manifest = FileManifest(sourcePath)
+    inList = [x for x in manifest.scan() if x[1].endswith(filetype)]
+    manifest.save()
     if len(inList) == 0:
         return [], []
-    # parse and unpack
-    parts = [os.path.split(x) for x in inList]
-    head, tail = list(zip(*parts))
-    # remove any hidden files
-    notHidden = [x[0] != '.' for x in tail]
-    head = compress(head, notHidden)
-    tail = compress(tail, notHidden)
-    head = [item for item in head]
-    tail = [item for item in tail]
-    # parse tail into filename and extension
+    # parse into sub path, filename and extension
+    subPath, tail = list(zip(*inList))
     parts = [os.path.splitext(x) for x in tail]
     fn, ext = list(zip(*parts))
 
@@ -116,52 +915,82 @@ def findFiles(sourcePath, filetype, destination, preserveSubFolders, mode):
     unqInds = uniqueIndexes(fn)
     if len(unqInds) != len(fn):
         print('Duplicate file names found in source folder...will only process one')
-        fn = [fn[i] for i in range(len(fn)) if i in unqInds]
-        ext = [ext[i] for i in range(len(ext)) if i in unqInds]
-        head = [head[i] for i in range(len(head)) if i in unqInds]
-    # getsub path if any
-    subPath = [removeLeadingPathSeparator(x.replace(sourcePath, '')) for x in head]
-    inFiles = [makeFileDict(sourcePath, subPath[x], fn[x], ext[x]) for x in range(len(fn))]
-    outFiles = createOutputFiles(inFiles, destination, preserveSubFolders, mode)
+        fn = [fn[i] for i in unqInds]
+        ext = [ext[i] for i in unqInds]
+        subPath = [subPath[i] for i in unqInds]
+    inFiles = FileTable([sourcePath] * len(fn), subPath, fn, ext)
+    outFiles = createOutputFiles(inFiles, destination, preserveSubFolders, mode, outputExt)
     return inFiles, outFiles
 
 
-def createOutputFiles(inFiles, newPath, preserveSubFolders, mode):
+def createOutputFiles(inFiles, newPath, preserveSubFolders, mode, ext=None):
     # asse,bles info about the files to output
-    outFiles = [deepcopy(x) for x in inFiles]
-    F = lambda x: x.update({'superPath': newPath})
-    [F(x) for x in outFiles];
-    if preserveSubFolders == False:  # remove path to subfolder from output files
-        F = lambda x: x.update({'subPath': ''})
-        [F(x) for x in outFiles]  # modify in situ
-    if mode == 'landmark':  # foutput file will be text
-        F = lambda x: x.update({'ext': '.txt'})
-        [F(x) for x in outFiles]  # modify in situ
+    if newPath is None:
+        raise ValueError('Output path must be given') # a FileTable would otherwise keep the path of the input files
+    if ext is not None:
+        pass
+    elif mode == 'landmark':  # foutput file will be text
+        ext = '.txt'
     elif mode == 'edit':  # output file will be obj
-        F = lambda x: x.update({'ext': '.obj'})
-        [F(x) for x in outFiles]  # modify in situ
+        ext = '.obj'
     elif mode == 'converttovtk':
-        F = lambda x: x.update({'ext': '.vtk'})
-        [F(x) for x in outFiles]  # modify in situ
+        ext = '.vtk'
     else:
         raise ValueError('Invalid mode')
-
+    if isinstance(inFiles, FileTable):
+        return inFiles.withPaths(superPath=newPath, subPath=None if preserveSubFolders else '', ext=ext)
+    outFiles = [makeFileDict(newPath, x['subPath'] if preserveSubFolders else '', x['fileName'], ext) for x in inFiles]
     return outFiles
 
 
-def writePolyDataToObj(polyData, fn):
-    # basic obj exporter for pyvista polydata since obj is not supported yet in pyvista.save
+def writeObjChunks(fileObj, fmt, rows, chunkSize):
+    # format rows of numbers chunkSize rows at a time, each chunk with a single string operation, and write them out
+    for i in range(0, rows.shape[0], chunkSize):
+        chunk = rows[i:i+chunkSize]
+        fileObj.write((fmt * chunk.shape[0]) % tuple(chunk.ravel().tolist()))
+
+
+def writePolyDataToObj(polyData, fn, topology=None, precision=6, chunkSize=100000, colorArray='RGB'):
+    # obj exporter for pyvista polydata since obj is not supported yet in pyvista.save
+    # streams to disk in chunks so that memory use doesn't depend on the size of the mesh
+    # normals ('Normals'), texture coordinates ('TCoords') and vertex colours (colorArray) are written if the mesh has them
     if os.path.splitext(fn)[1] != '.obj':
         raise ValueError('Filename does not have \'.obj\' extension')
-    verts = polyData.points.astype(str)
-    verts = np.concatenate((np.tile('v',[verts.shape[0],1]), verts),axis=1)
-    faces = np.reshape(polyData.faces, (int(len(polyData.faces) / 4), 4));
-    faces = faces[:, 1:] + 1  # remove first column and add 1 to the index
-    faces = np.concatenate((np.tile('f', [faces.shape[0], 1]), faces.astype(str)), axis=1)
-
-    with open(fn, 'w') as csvfile:
-            writerobj = csv.writer(csvfile, delimiter=' ')
-            writerobj.writerows(np.concatenate((verts,faces),axis=0))
+    if topology is None:
+        faces = np.reshape(polyData.faces, (int(len(polyData.faces) / 4), 4));
+        faces = faces[:, 1:]  # remove first column
+    else:
+        faces = topology.Faces
+    pointData = polyData.point_data
+    normals = pointData['Normals'] if 'Normals' in pointData.keys() else pointData.active_normals
+    uvs = pointData['TCoords'] if 'TCoords' in pointData.keys() else None
+    colors = pointData[colorArray] if colorArray in pointData.keys() else None
+    num = ' %.' + str(int(precision)) + 'f'
+
+    with open(fn, 'w') as objFile:
+        if colors is None:
+            writeObjChunks(objFile, 'v' + num * 3 + '\n', np.asarray(polyData.points), chunkSize)
+        else:
+            colors = np.asarray(colors)
+            if colors.dtype == np.uint8:
+                colors = colors / 255
+            verts = np.concatenate((np.asarray(polyData.points), colors[:, :3]), axis=1)
+            writeObjChunks(objFile, 'v' + num * 6 + '\n', verts, chunkSize)
+        if uvs is not None:
+            writeObjChunks(objFile, 'vt' + num * 2 + '\n', np.asarray(uvs), chunkSize)
+        if normals is not None:
+            writeObjChunks(objFile, 'vn' + num * 3 + '\n', np.asarray(normals), chunkSize)
+        # the normals and texture coordinates are per vertex so share the vertex index
+        if (uvs is not None) & (normals is not None):
+            fmt, cols = 'f %d/%d/%d %d/%d/%d %d/%d/%d\n', [0, 0, 0, 1, 1, 1, 2, 2, 2]
+        elif uvs is not None:
+            fmt, cols = 'f %d/%d %d/%d %d/%d\n', [0, 0, 1, 1, 2, 2]
+        elif normals is not None:
+            fmt, cols = 'f %d//%d %d//%d %d//%d\n', [0, 0, 1, 1, 2, 2]
+        else:
+            fmt, cols = 'f %d %d %d\n', [0, 1, 2]
+        for i in range(0, faces.shape[0], chunkSize):
+            writeObjChunks(objFile, fmt, faces[i:i+chunkSize, cols] + 1, chunkSize) # obj indices start at 1
 
 
 def writeLandmarksToText(landmarks, fn):
@@ -170,29 +999,251 @@ def writeLandmarksToText(landmarks, fn):
         for i in range(len(landmarks)):
             row = [str(item) for item in landmarks[i]]
             writerobj.writerow(row)
+
+def writeLandmarksToNpy(landmarks, fn):
+    np.save(fn, np.asarray(landmarks, dtype=float).reshape(-1, 3))
+
+def writeLandmarks(landmarks, fn):
+    # landmarks to a binary .npy file or, for any other extension, a comma delimited text file
+    if os.path.splitext(fn)[1].lower() == '.npy':
+        writeLandmarksToNpy(landmarks, fn)
+    else:
+        writeLandmarksToText(landmarks, fn)
+
+def readLandmarks(fn):
+    # n x 3 array of the landmarks in a file written by writeLandmarks
+    if os.path.splitext(fn)[1].lower() == '.npy':
+        return np.load(fn).reshape(-1, 3)
+    with open(fn, 'r') as f:
+        text = f.read()
+    return np.array(text.replace(',', ' ').split(), dtype=float).reshape(-1, 3)
+
+
+class LandmarkTable:
+    # appendable table of the landmarks of many meshes in a single .npy file, one row per mesh keyed by name
+    # each row holds the name, the number of landmarks and the landmarks padded with nan to the width of the table
+    # the file is an ordinary .npy file (np.load reads it) whose header is padded so the row count can be rewritten in place after appending
+    HeaderBytes = 512
+    NameLength = 256
+
+    def __init__(self, fn, maxLandmarks=None):
+        self.FileName = fn
+        self.MaxLandmarks = maxLandmarks # width of a new table, by default the number of landmarks in the first row written
+        # the table is widened when a row with more landmarks than its width is added
+
+    def _dtype(self, maxLandmarks):
+        return np.dtype([('name', 'U' + str(self.NameLength)), ('count', '<i4'), ('landmarks', '<f8', (maxLandmarks, 3))])
+
+    def _writeHeader(self, f, dtype, nRows):
+        header = "{'descr': " + repr(np.lib.format.dtype_to_descr(dtype)) + ", 'fortran_order': False, 'shape': (" + str(nRows) + ",), }"
+        header = header.ljust(self.HeaderBytes - 11) + '\n'
+        f.seek(0)
+        f.write(b'\x93NUMPY\x01\x00' + np.uint16(len(header)).tobytes() + header.encode('latin1'))
+
+    def _readHeader(self):
+        with open(self.FileName, 'rb') as f:
+            np.lib.format.read_magic(f)
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        return shape[0], dtype
+
+    def append(self, name, landmarks):
+        self.extend([name], [landmarks])
+
+    def extend(self, names, landmarkSets):
+        # add a row for each name, a name that is already in the table is superseded by its latest row
+        landmarkSets = [np.asarray(x, dtype=float).reshape(-1, 3) for x in landmarkSets]
+        if os.path.isfile(self.FileName):
+            nRows, dtype = self._readHeader()
+        else:
+            nRows = 0
+            width = self.MaxLandmarks if self.MaxLandmarks is not None else max(len(x) for x in landmarkSets)
+            dtype = self._dtype(width)
+            with open(self.FileName, 'wb') as f:
+                self._writeHeader(f, dtype, 0)
+        width = dtype['landmarks'].shape[0]
+        if max(len(x) for x in landmarkSets) > width:
+            width = max(len(x) for x in landmarkSets)
+            dtype = self._widen(nRows, dtype, width)
+        rows = np.zeros(len(names), dtype=dtype)
+        rows['landmarks'] = np.nan
+        for i, (name, lm) in enumerate(zip(names, landmarkSets)):
+            if len(name) > self.NameLength:
+                raise ValueError('Name is longer than ' + str(self.NameLength) + ' characters: ' + name)
+            rows[i]['name'] = name
+            rows[i]['count'] = len(lm)
+            rows[i]['landmarks'][:len(lm)] = lm
+        # write the rows after the last complete one (dropping anything left by an interrupted append), then the new count
+        with open(self.FileName, 'r+b') as f:
+            f.seek(self.HeaderBytes + nRows * dtype.itemsize)
+            f.write(rows.tobytes())
+            f.truncate()
+            f.flush()
+            self._writeHeader(f, dtype, nRows + len(rows))
+
+    def _widen(self, nRows, dtype, width):
+        # rewrites the first nRows rows of the table padded to width landmarks, replacing the file only once the copy is complete
+        old = np.fromfile(self.FileName, dtype=dtype, count=nRows, offset=self.HeaderBytes)
+        newType = self._dtype(width)
+        rows = np.zeros(nRows, dtype=newType)
+        rows['landmarks'] = np.nan
+        rows['name'] = old['name']
+        rows['count'] = old['count']
+        rows['landmarks'][:, :dtype['landmarks'].shape[0]] = old['landmarks']
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.FileName)), suffix='.npy')
+        with os.fdopen(fd, 'wb') as f:
+            self._writeHeader(f, newType, nRows)
+            f.write(rows.tobytes())
+        os.replace(tmp, self.FileName)
+        return newType
+
+    def read(self):
+        # the latest row of each name, in the order the names were first written
+        rows = np.load(self.FileName)
+        _, first = np.unique(rows['name'], return_index=True)
+        _, last = np.unique(rows['name'][::-1], return_index=True)
+        return rows[len(rows) - 1 - last[np.argsort(first)]]
+
+
+def landmarkFiles(directory, extensions=('.txt', '.npy')):
+    # (name, path) of every landmark file under directory, named by their path relative to it without the extension
+    out = []
+    for subPath, name in FileManifest(directory).scan():
+        stem, ext = os.path.splitext(name)
+        if ext.lower() in extensions:
+            out.append(('/'.join([x for x in [subPath.replace(os.sep, '/'), stem] if x != '']), os.path.join(directory, subPath, name)))
+    return out
+
+def consolidateLandmarks(directory, fn, maxLandmarks=None):
+    # reads every landmark file under directory (e.g. '22 TEXT POSE POINTS') in one pass and writes them to a LandmarkTable
+    # so that all landmarks can then be loaded with a single read
+    files = landmarkFiles(directory)
+    names = [x[0] for x in files]
+    landmarkSets = [readLandmarks(x[1]) for x in files]
+    if os.path.isfile(fn):
+        os.remove(fn)
+    table = LandmarkTable(fn, maxLandmarks)
+    if len(names) > 0:
+        table.extend(names, landmarkSets)
+    return table
 def removeExistingFiles(inFiles,outFiles):
-    notExisting = [fileExists(x) == False for x in outFiles]
-    inFiles = compress(inFiles, notExisting)
-    inFiles = [x for x in inFiles]
-    outFiles = compress(outFiles, notExisting)
-    outFiles = [x for x in outFiles]
-    return inFiles, outFiles
+    # lists each output directory once rather than checking every file separately
+    listed = dict()
+    notExisting = []
+    for x in outFiles:
+        path = os.path.join(x['superPath'], x['subPath'])
+        if path not in listed:
+            try:
+                with os.scandir(path) as it:
+                    listed[path] = set(e.name for e in it if e.is_file())
+            except OSError:
+                listed[path] = set()
+        notExisting.append((x['fileName'] + x['ext']) not in listed[path])
+    return selectFiles(inFiles, notExisting), selectFiles(outFiles, notExisting)
+
+
+def removeUpToDateFiles(inFiles,outFiles):
+    # keeps the pairs whose output is missing or older than the input
+    keep = []
+    for inFile, outFile in zip(inFiles, outFiles):
+        outPath = dictToPath(outFile)
+        keep.append((os.path.isfile(outPath) == False) or (os.path.getmtime(outPath) < os.path.getmtime(dictToPath(inFile))))
+    return selectFiles(inFiles, keep), selectFiles(outFiles, keep)
+
+
+def convertFileToVtk(inFile, outFile, cacheDir=None):
+    # loads one file and saves it in vtk format, returns the input path and an error message (None on success)
+    # defined at module level so that it can run in a process pool
+    try:
+        shp,_ = load3DImage(inFile, cacheDir)
+        if shp is None:
+            return dictToPath(inFile), 'could not be loaded'
+        shp.save(dictToPath(outFile),binary=True,texture = True)
+    except Exception as e:
+        return dictToPath(inFile), str(e)
+    finally:
+        inFile['polydata'] = None # not needed any more
+    return dictToPath(inFile), None
+
+
+def fileContentHash(fn, blockSize=2**20):
+    # hash of the contents of a file, used to key the mesh cache
+    h = hashlib.blake2b(digest_size=16)
+    with open(fn, 'rb') as f:
+        for block in iter(lambda: f.read(blockSize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def readMeshCache(cacheDir, key):
+    # mesh stored by writeMeshCache, or None if it is not in the cache
+    fn = os.path.join(cacheDir, key + '.npz')
+    if os.path.isfile(fn) == False:
+        return None
+    with np.load(fn) as arrays:
+        shp = pv.PolyData(arrays['points'], arrays['faces'])
+        for name in arrays.files:
+            if name.startswith('pointdata_'):
+                shp.point_data[name[len('pointdata_'):]] = arrays[name]
+    return shp
+
+
+def writeMeshCache(cacheDir, key, shp):
+    # store the points, faces and point data of a cleaned and triangulated mesh as uncompressed arrays
+    os.makedirs(cacheDir, exist_ok=True) # another process may be making it too
+    arrays = {'points': np.asarray(shp.points), 'faces': np.asarray(shp.faces)}
+    for name in shp.point_data.keys():
+        arrays['pointdata_' + name] = np.asarray(shp.point_data[name])
+    # written under a name unique to this call, so that processes caching files with the same contents don't write over each other
+    fd, tmp = tempfile.mkstemp(dir=cacheDir, suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, os.path.join(cacheDir, key + '.npz')) # so that a half written file is never read
+    except:
+        os.remove(tmp)
+        raise
 
 
-def load3DImage(fileDict):
+def load3DImage(fileDict, cacheDir=None, timings=None):
+    # if cacheDir is given the cleaned and triangulated mesh is stored there, keyed by the contents of the file, and reused by later loads
+    # if a dictionary is given as timings, the seconds spent reading, cleaning and triangulating and the bytes read are added to it
     fn = dictToPath(fileDict)
+    if timings is None:
+        timings = dict()
+    t = time.perf_counter()
     try:
         print('Loading '+fn)
-        shp = pv.read(fn)
-        if shp.n_points==0:
-            print('Mesh '+fn + 'is empty')
-            raise ValueError()
-        shp.clean(inplace=True)
-        print('Finished Loading')
-        if shp.is_all_triangles == False:
-            print('Triangulating ' + fn)
-            shp.triangulate(inplace=True)
-            print('Finished Triangulating')
+        shp = None
+        timings['bytesRead'] = 0
+        if cacheDir is not None:
+            key = fileContentHash(fn)
+            timings['bytesRead'] += os.path.getsize(fn)
+            shp = readMeshCache(cacheDir, key)
+            timings['cached'] = shp is not None
+            if shp is not None:
+                timings['bytesRead'] += os.path.getsize(os.path.join(cacheDir, key + '.npz'))
+        if shp is None:
+            shp = pv.read(fn)
+            timings['bytesRead'] += os.path.getsize(fn)
+            if shp.n_points==0:
+                print('Mesh '+fn + 'is empty')
+                raise ValueError()
+            timings['load'] = time.perf_counter() - t
+            t = time.perf_counter()
+            shp.clean(inplace=True)
+            timings['clean'] = time.perf_counter() - t
+            print('Finished Loading')
+            t = time.perf_counter()
+            if shp.is_all_triangles == False:
+                print('Triangulating ' + fn)
+                shp.triangulate(inplace=True)
+                print('Finished Triangulating')
+            timings['triangulate'] = time.perf_counter() - t
+            if cacheDir is not None:
+                writeMeshCache(cacheDir, key, shp)
+        else:
+            timings['load'] = time.perf_counter() - t
+            print('Finished Loading (cached)')
     except:
         print('Unable to load ' + fn)
         shp = None
@@ -201,7 +1252,420 @@ def load3DImage(fileDict):
     return shp, fileDict
 
 
+def meshBytes(shp):
+    # approximate memory held by a mesh
+    if shp is None:
+        return 0
+    return shp.actual_memory_size * 1024 # vtk reports kibibytes
+
+
+class MeshCache:
+    # keeps the meshes of a list of files in memory up to budgetBytes, evicting the least recently used ones
+    # meshes that are not in the cache are (re)loaded on demand through load3DImage
+    # Hits, Misses and Evictions count how it has been doing so that the budget can be sized
+    def __init__(self, files, budgetBytes, cacheDir=None):
+        self._Files = files
+        self.BudgetBytes = budgetBytes
+        self._CacheDir = cacheDir
+        self._Meshes = OrderedDict() # file index: (polydata, bytes), least recently used first
+        self.LoadTimings = dict() # file index: timings from load3DImage of the files the cache loaded itself
+        self._Lock = Lock()
+        self.Bytes = 0
+        self.Hits = 0
+        self.Misses = 0
+        self.Evictions = 0
+        self._Largest = 0 # bytes of the largest mesh put in the cache, used to predict whether the next one fits
+
+    def __contains__(self, i):
+        with self._Lock:
+            return i in self._Meshes
+
+    def __len__(self):
+        return len(self._Meshes)
+
+    def get(self, i, loader=None):
+        # mesh of file i (None if it could not be loaded), loaded with loader() or load3DImage if it is not in the cache
+        with self._Lock:
+            if i in self._Meshes:
+                self.Hits += 1
+                self._Meshes.move_to_end(i)
+                return self._Meshes[i][0]
+            self.Misses += 1
+        if loader is None:
+            shp, _ = load3DImage(self._Files[i], self._CacheDir, self.LoadTimings.setdefault(i, dict()))
+        else:
+            shp = loader()
+        self._Files[i]['polydata'] = None # the cache holds the only reference
+        if shp is not None:
+            self._put(i, shp)
+        return shp
+
+    def _put(self, i, shp):
+        with self._Lock:
+            if i in self._Meshes:
+                self.Bytes -= self._Meshes.pop(i)[1]
+            nBytes = meshBytes(shp)
+            self._Meshes[i] = (shp, nBytes)
+            self.Bytes += nBytes
+            self._Largest = max(self._Largest, nBytes)
+            # evict down to the budget, but always keep the mesh just added
+            while (self.Bytes > self.BudgetBytes) & (len(self._Meshes) > 1):
+                _, (_, evicted) = self._Meshes.popitem(last=False)
+                self.Bytes -= evicted
+                self.Evictions += 1
+
+    def preload(self, i):
+        # load file i into the cache only if it fits in what is left of the budget, never evicting anything
+        # returns False once the cache is full, predicted from the largest mesh so far so that a mesh is rarely loaded only to be dropped
+        if (self.BudgetBytes <= 0) or (self.Bytes + self._Largest > self.BudgetBytes):
+            return False
+        with self._Lock:
+            if i in self._Meshes:
+                return True
+        shp, _ = load3DImage(self._Files[i], self._CacheDir, self.LoadTimings.setdefault(i, dict()))
+        self._Files[i]['polydata'] = None
+        if shp is None:
+            return True # nothing to hold, carry on with the next file
+        nBytes = meshBytes(shp)
+        self._Largest = max(self._Largest, nBytes)
+        if self.Bytes + nBytes > self.BudgetBytes:
+            return False # loaded again when it is needed
+        self._put(i, shp)
+        return True
+
+    def discard(self, i):
+        # drop the mesh of file i, e.g. once it has been edited, without counting it as an eviction
+        with self._Lock:
+            if i in self._Meshes:
+                self.Bytes -= self._Meshes.pop(i)[1]
+
+    def clear(self):
+        with self._Lock:
+            self._Meshes = OrderedDict()
+            self.Bytes = 0
+
+    def report(self):
+        return ('Mesh cache: ' + str(self.Hits) + ' hits, ' + str(self.Misses) + ' misses, ' + str(self.Evictions)
+                + ' evictions, ' + str(len(self._Meshes)) + ' meshes (' + str(round(self.Bytes / 2**20, 1)) + ' of '
+                + str(round(self.BudgetBytes / 2**20, 1)) + ' MB) held')
+
+
+def sharedMeshDirectory():
+    # where shareMesh puts its files by default - in memory (/dev/shm) where there is such a thing
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def shareMesh(shp, directory=None):
+    # writes the points, triangles and point data of a triangle mesh into one file that another process can map with meshFromShared
+    # returns a small picklable description of the file, so that only that has to be sent between processes rather than the arrays
+    if directory is None:
+        directory = sharedMeshDirectory()
+    arrays = {'points': np.asarray(shp.points), 'faces': np.asarray(shp.regular_faces, dtype=np.int64)}
+    for name in shp.point_data.keys():
+        arrays['pointdata_' + name] = np.asarray(shp.point_data[name])
+    fd, fn = tempfile.mkstemp(suffix='.mesh', dir=directory)
+    layout = dict() # name: (offset, shape, dtype)
+    offset = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for name, arr in arrays.items():
+                arr = np.ascontiguousarray(arr)
+                offset = -(-offset // 64) * 64 # aligned for the views made on the other side
+                f.seek(offset)
+                arr.tofile(f)
+                layout[name] = (offset, arr.shape, arr.dtype.str)
+                offset += arr.nbytes
+    except:
+        os.remove(fn) # e.g. /dev/shm is full, don't leave a partial file taking up the space
+        raise
+    return {'file': fn, 'arrays': layout}
+
+
+def meshFromShared(shared):
+    # mesh made by mapping the file written by shareMesh, whose arrays are views of the mapping rather than copies
+    # the mapping is copy on write so the file is never changed, and the file is deleted once it is no longer needed
+    fn = shared['file']
+    mm = np.memmap(fn, mode='c')
+    views = dict()
+    for name, (offset, shape, dtype) in shared['arrays'].items():
+        dtype = np.dtype(dtype)
+        views[name] = mm[offset:offset + int(np.prod(shape)) * dtype.itemsize].view(dtype).reshape(shape)
+    shp = pv.PolyData.from_regular_faces(views.pop('points'), views.pop('faces'))
+    for name, arr in views.items():
+        shp.point_data[name[len('pointdata_'):]] = arr
+    try:
+        os.remove(fn) # the mapping stays valid where this is allowed
+    except OSError:
+        weakref.finalize(mm, os.remove, fn) # otherwise when the mapping is released
+    return shp
+
+
+def discardShared(future):
+    # done callback of a loadMeshShared future whose mesh is not wanted any more, deletes its file
+    if (future.cancelled() == False) and (future.exception() is None) and (future.result()[0] is not None):
+        try:
+            os.remove(future.result()[0]['file'])
+        except OSError:
+            pass
+
+
+def loadMeshShared(fileDict, cacheDir=None, directory=None):
+    # load3DImage for a worker process, returning the mesh as a shareMesh description (or None if it could not be loaded)
+    # and the load3DImage timings
+    timings = dict()
+    shp, _ = load3DImage(fileDict, cacheDir, timings)
+    fileDict['polydata'] = None
+    if shp is None:
+        return None, timings
+    try:
+        return shareMesh(shp, directory), timings
+    except Exception as e:
+        # as for a file that can't be loaded, so that one mesh doesn't stop the batch
+        print('Unable to share ' + dictToPath(fileDict) + ': ' + str(e))
+        return None, timings
+
+
+class MeshPrefetcher:
+    # loads the next few files of a list on worker threads while the current one is being edited
+    # at most depth meshes are loaded or loading at any time, on top of the one that was last handed out
+    # if a MeshCache is given, files already in it are not loaded again and loaded meshes are added to it
+    # if processes is True the files are loaded in worker processes instead and handed over through shareMesh without copying
+    def __init__(self, files, depth=2, cacheDir=None, meshCache=None, processes=False):
+        self._Files = files
+        self.Depth = max(int(depth), 1)
+        self._CacheDir = cacheDir
+        self._MeshCache = meshCache
+        self._Processes = processes
+        if processes:
+            self._Executor = ProcessPoolExecutor(max_workers=self.Depth)
+        else:
+            self._Executor = ThreadPoolExecutor(max_workers=self.Depth)
+        self._Pending = dict() # file index: future returning (polydata, file dict), or a shareMesh description and timings
+        self.LoadTimings = dict() # file index: timings from load3DImage of the files loaded here
+
+    def _fill(self, i):
+        # drop anything before i that was never collected and keep files i to i+depth-1 loading
+        for j in [j for j in self._Pending.keys() if j < i]:
+            self._discard(self._Pending.pop(j))
+        for j in range(i, min(i + self.Depth, len(self._Files))):
+            if (j not in self._Pending) and ((self._MeshCache is None) or (j not in self._MeshCache)):
+                if self._Processes:
+                    self._Pending[j] = self._Executor.submit(loadMeshShared, self._Files[j], self._CacheDir)
+                else:
+                    self.LoadTimings[j] = dict()
+                    self._Pending[j] = self._Executor.submit(load3DImage, self._Files[j], self._CacheDir, self.LoadTimings[j])
+
+    def _result(self, i, future):
+        if self._Processes:
+            shared, self.LoadTimings[i] = future.result()
+            return None if shared is None else meshFromShared(shared)
+        return future.result()[0]
+
+    def get(self, i):
+        # mesh of file i (None if it could not be loaded), waiting for it if it is still loading
+        self._fill(i)
+        if self._MeshCache is None:
+            shp = self._result(i, self._Pending.pop(i))
+        else:
+            future = self._Pending.pop(i, None)
+            loader = None if future is None else partial(self._result, i, future)
+            shp = self._MeshCache.get(i, loader)
+        self._fill(i + 1)
+        return shp
+
+    def _discard(self, future):
+        if (future.cancel() == False) and self._Processes: # already loading or loaded
+            future.add_done_callback(discardShared)
+
+    def loadTimings(self, i):
+        # timings of loading file i, whether it was loaded here or by the MeshCache
+        if i in self.LoadTimings:
+            return self.LoadTimings.pop(i)
+        if self._MeshCache is not None:
+            return self._MeshCache.LoadTimings.pop(i, dict())
+        return dict()
+
+    def close(self):
+        for future in self._Pending.values():
+            self._discard(future)
+        self._Pending = dict()
+        self._Executor.shutdown(wait=True)
+
+
+class CallbackProfiler:
+    # timings of named callbacks, keeping the last Window durations of each for rolling statistics and latency histograms
+    BinEdges = np.concatenate(([0], np.logspace(-1, 4, 21))) # milliseconds, log spaced from 0.1 ms to 10 s
+
+    def __init__(self, window=1000):
+        self.Window = window
+        self._Samples = OrderedDict() # name: deque of the latest durations in seconds
+        self.Counts = dict() # name: number of calls since the start
+
+    def record(self, name, seconds):
+        if name not in self._Samples:
+            self._Samples[name] = deque(maxlen=self.Window)
+            self.Counts[name] = 0
+        self._Samples[name].append(seconds)
+        self.Counts[name] += 1
+
+    def wrap(self, name, fn):
+        # fn timed under name, wraps keeps its signature (pyvista checks the signature of key callbacks)
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            t = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - t)
+        return timed
+
+    def histogram(self, name):
+        # number of the recent calls of name in each bin of BinEdges
+        return np.histogram(np.asarray(self._Samples[name]) * 1000, bins=self.BinEdges)[0]
+
+    def stats(self, name):
+        # statistics in milliseconds of the recent calls of name
+        ms = np.asarray(self._Samples[name]) * 1000
+        return {'calls': self.Counts[name], 'last': ms[-1], 'mean': np.mean(ms), 'p50': np.percentile(ms, 50),
+                'p95': np.percentile(ms, 95), 'max': np.max(ms)}
+
+    def names(self):
+        return list(self._Samples.keys())
+
+    def summary(self):
+        # table of the statistics of every callback
+        lines = ['Callback timings (ms) over the last ' + str(self.Window) + ' calls of each',
+                 'callback'.ljust(28) + ''.join(x.rjust(10) for x in ['calls', 'mean', 'p50', 'p95', 'max'])]
+        for name in self.names():
+            st = self.stats(name)
+            lines.append(name.ljust(28) + str(st['calls']).rjust(10) + ''.join(format(st[x], '.2f').rjust(10) for x in ['mean', 'p50', 'p95', 'max']))
+        return '\n'.join(lines)
+
+    def toDict(self):
+        out = {'binEdgesMs': self.BinEdges.tolist(), 'callbacks': dict()}
+        for name in self.names():
+            out['callbacks'][name] = {key: float(value) for key, value in self.stats(name).items()}
+            out['callbacks'][name]['histogram'] = self.histogram(name).tolist()
+        return out
+
+    def save(self, fn):
+        with open(fn, 'w') as f:
+            json.dump(self.toDict(), f, indent=1)
+
+
+class BatchMetrics:
+    # per file timings and bytes of a batch, written as json lines to fn (if given) as each file finishes
+    # every line has an 'event': 'discovery' for finding the files, 'file' for each file and 'summary' at the end
+    Phases = ['wait', 'load', 'clean', 'triangulate', 'operations', 'interactive', 'save', 'total'] # seconds recorded per file
+
+    def __init__(self, fn=None, slowest=10):
+        self.FileName = fn
+        self.Slowest = slowest # number of slowest files listed in the summary
+        self.Files = [] # the 'file' records
+        self.Discovery = None
+        self.NFiles = None
+        self._Start = None
+        self._File = None
+        if fn is not None:
+            head, _ = os.path.split(fn)
+            if (head != '') and (os.path.isdir(head) == False):
+                os.makedirs(head)
+            self._File = open(fn, 'a', buffering=1) # line buffered so the log is complete up to the last file if the batch dies
+
+    def _write(self, record):
+        if self._File is not None:
+            self._File.write(json.dumps(record) + '\n')
+
+    def discovery(self, seconds, nFiles, **info):
+        self.Discovery = dict(event='discovery', time=time.time(), seconds=seconds, files=nFiles, **info)
+        self._write(self.Discovery)
+
+    def start(self, nFiles):
+        # call when processing starts, the throughput and completion estimate are relative to this
+        self.NFiles = nFiles
+        self._Start = time.perf_counter()
+
+    @property
+    def Elapsed(self):
+        return 0. if self._Start is None else time.perf_counter() - self._Start
+
+    def file(self, path, error=None, **values):
+        # values are the seconds of each phase in Phases and bytesRead/bytesWritten, anything else is recorded as given
+        record = dict(event='file', time=time.time(), path=path, error=error, **values)
+        self.Files.append(record)
+        if self.NFiles is not None:
+            done = len(self.Files)
+            record['done'] = done
+            record['remaining'] = self.NFiles - done
+            record['etaSeconds'] = self.Elapsed / done * (self.NFiles - done)
+        self._write(record)
+        return record
+
+    def progress(self):
+        # time of the last file and the estimated time to finish, for printing
+        record = self.Files[-1]
+        out = format(record.get('total', 0), '.1f') + ' s'
+        if 'etaSeconds' in record:
+            out += ', about ' + format(record['etaSeconds'] / 60, '.1f') + ' min remaining'
+        return out
+
+    def summary(self):
+        elapsed = self.Elapsed
+        nOk = sum(1 for r in self.Files if r['error'] is None)
+        bytesRead = sum(r.get('bytesRead', 0) for r in self.Files)
+        bytesWritten = sum(r.get('bytesWritten', 0) for r in self.Files)
+        out = {'event': 'summary', 'time': time.time(), 'files': len(self.Files), 'succeeded': nOk,
+               'failed': len(self.Files) - nOk, 'wallSeconds': elapsed,
+               'filesPerHour': len(self.Files) / elapsed * 3600 if elapsed > 0 else None,
+               'bytesRead': bytesRead, 'bytesWritten': bytesWritten,
+               'readMBPerSecond': bytesRead / 2**20 / elapsed if elapsed > 0 else None,
+               'discoverySeconds': None if self.Discovery is None else self.Discovery['seconds'],
+               'phases': dict()}
+        for phase in self.Phases:
+            seconds = np.array([r[phase] for r in self.Files if r.get(phase) is not None], dtype=float)
+            if len(seconds) > 0:
+                out['phases'][phase] = {'files': len(seconds), 'sum': float(seconds.sum()), 'mean': float(seconds.mean()),
+                                        'p50': float(np.percentile(seconds, 50)), 'p90': float(np.percentile(seconds, 90)),
+                                        'p99': float(np.percentile(seconds, 99)), 'max': float(seconds.max())}
+        slowest = sorted(self.Files, key=lambda r: r.get('total', 0), reverse=True)[:self.Slowest]
+        out['slowest'] = [{'path': r['path'], 'total': r.get('total')} for r in slowest]
+        return out
+
+    def report(self, summary=None):
+        # summary as a table for printing
+        if summary is None:
+            summary = self.summary()
+        lines = [str(summary['files']) + ' files (' + str(summary['failed']) + ' failed) in ' + format(summary['wallSeconds'], '.1f') + ' s, '
+                 + format(summary['filesPerHour'] or 0, '.0f') + ' files per hour, '
+                 + format(summary['bytesRead'] / 2**20, '.1f') + ' MB read, ' + format(summary['bytesWritten'] / 2**20, '.1f') + ' MB written',
+                 'phase (s)'.ljust(14) + ''.join(x.rjust(10) for x in ['files', 'sum', 'p50', 'p90', 'p99', 'max'])]
+        for phase, st in summary['phases'].items():
+            lines.append(phase.ljust(14) + str(st['files']).rjust(10) + ''.join(format(st[x], '.2f').rjust(10) for x in ['sum', 'p50', 'p90', 'p99', 'max']))
+        if len(summary['slowest']) > 0:
+            lines.append('slowest files:')
+            lines += ['  ' + format(r['total'] or 0, '.2f').rjust(8) + ' s  ' + r['path'] for r in summary['slowest']]
+        return '\n'.join(lines)
+
+    def finish(self):
+        # writes and prints the summary and closes the log
+        summary = self.summary()
+        self._write(summary)
+        if self._File is not None:
+            self._File.close()
+            self._File = None
+        print(self.report(summary))
+        return summary
+
+
 class MeshEditor:
+    # colours (uint8 RGB) of the vertices in 'edit' mode
+    UnselectedRGB = np.array([178, 178, 178], dtype='uint8')
+    SelectedRGB = np.array([255, 0, 0], dtype='uint8')
+    BrushRGB = np.array([0, 255, 255], dtype='uint8')
+    GeodesicRGB = np.array([25, 127, 25], dtype='uint8')
+
     @property
     def VertexRGB(self): # color of each node of the mesh in 'edit' mode
         if (self.SelectedVertices is None) | (self.VerticesInRadius is None):
@@ -209,19 +1673,48 @@ class MeshEditor:
                 return None
             else:
                 NP = self.mesh.n_points
-                out = np.ones([NP,3])*0.7*255
-                return out.astype('uint8')
+                return np.tile(self.UnselectedRGB, [NP, 1])
         else:
-            NP = self.mesh.n_points
-            out = np.ones([NP, 3]) * 0.7
-            out[self.SelectedVertices.astype('bool'),:] = [1,0,0]
-            if (self.VertexSelectionMode=='Brushing') | (self.VertexSelectionMode is None):
-                col = [0,1,1]
-            elif self.VertexSelectionMode=='Geodesic':
-                col = [.1, .5, .1]
-            out[self.VerticesInRadius.astype('bool'),:] = col
-            out = (out*255).astype('uint8')
-            return out
+            return self.vertexColors(slice(None))
+
+    def vertexColors(self, inds):
+        # color of the vertices indexed by inds (indices or slice) in 'edit' mode
+        return self._flagColors(self.SelectedVertices[inds], self.VerticesInRadius[inds])
+
+    def displayColors(self, inds):
+        # color of the displayed vertices indexed by inds, which are the vertices of the display proxy if there is one
+        # a proxy vertex shows the brush if any of its vertices are in the brush and is selected if at least half of them are
+        if self.displayProxy is None:
+            return self.vertexColors(inds)
+        members, group = self.displayProxy.members(inds)
+        n = len(inds)
+        selected = np.bincount(group, weights=self.SelectedVertices[members], minlength=n) * 2 >= self.displayProxy.Counts[inds]
+        inRadius = np.bincount(group, weights=self.VerticesInRadius[members], minlength=n) > 0
+        return self._flagColors(selected, inRadius)
+
+    def _flagColors(self, selected, inRadius):
+        out = np.empty([selected.shape[0], 3], dtype='uint8')
+        out[:] = self.UnselectedRGB
+        out[selected, :] = self.SelectedRGB
+        if (self.VertexSelectionMode=='Brushing') | (self.VertexSelectionMode is None):
+            col = self.BrushRGB
+        elif self.VertexSelectionMode=='Geodesic':
+            col = self.GeodesicRGB
+        out[inRadius, :] = col
+        return out
+
+    # the landmarks placed in 'landmark' mode (n x 3), the triangle of the mesh each lies on and their barycentric coordinates within it
+    @property
+    def landmarks(self):
+        return self.landmarkCloud.Points.Array
+
+    @property
+    def landmarkFaces(self):
+        return self._LandmarkFaces.Array
+
+    @property
+    def landmarkBarycentric(self):
+        return self._LandmarkBarycentric.Array
 
     @property
     def BackgroundColor(self):
@@ -241,12 +1734,45 @@ class MeshEditor:
 
 
 
-    def __init__(self, S, mode, landmark_size=4, saveFileName=None):
+    def __init__(self, S, mode, landmark_size=4, saveFileName=None, displayFaces=None, templateLandmarks=None,
+                 landmarkTable=None, landmarkKey=None, sessionLog=True, profile=False):
+        # if displayFaces is given, meshes with more triangles than that are shown in 'edit' mode through a DisplayProxy of about that many triangles
+        # if templateLandmarks (n x 3) is given in 'landmark' mode, they are projected onto the mesh and placed before editing starts
+        # if landmarkTable (a file name) is given, saved landmarks are also appended to that LandmarkTable under landmarkKey
+        # (by default the name of saveFileName without its extension)
+        # if sessionLog is True and saveFileName is given, edits are logged to saveFileName + '.session' and a session that ended without
+        # saving is resumed when the same mesh is opened again
+        # if profile is True (or a file name) the callbacks and renders are timed in a CallbackProfiler, with the frame time shown on screen and
+        # a summary printed (or saved as json to that file) when the editor is closed
         # declare some proerties
         self.SelectedVertices = np.zeros([S.n_points]).astype('bool')
         self.VerticesInRadius = np.zeros([S.n_points]).astype('bool')
-        self._RecordDeletions=[]
-        self._MeshCopy = None
+        self.history = None # record of the deletions in 'edit' mode for undo and redo
+        self._PointTree = None # spatial index of the mesh points, rebuilt whenever the points change
+        self._InRadiusIndices = np.zeros(0,dtype=int) # indices of the vertices currently flagged in VerticesInRadius
+        self._DirtyVertices = [] # index arrays of vertices whose colour needs rewriting at the next colour update
+        self.topology = None # edges and adjacency of the mesh in 'edit' mode, kept up to date as vertices are deleted
+        self._GeodesicFront = None # truncated geodesic distances around the current seed when geodesic brushing
+        self.GeodesicBrushing = False # if True the brush selects within a geodesic rather than euclidean radius
+        self.displayProxy = None # coarse copy of the mesh shown instead of it in 'edit' mode when it is large
+        self.displayMesh = None # the mesh that is rendered, either the edited mesh or displayProxy.Mesh
+        self.sessionLog = None # SessionLog the edits are recorded in
+        self.checkpointInterval = 1. # minimum number of seconds between logging changes to the selection
+        self._LoggedSelection = None # the selection as it is in the session log
+        self._LastCheckpoint = 0.
+        self._Replaying = False # True while the session log is being replayed, so nothing is logged again
+        self._Saved = False
+        self.SaveSeconds = 0. # time spent saving, so that batch metrics can separate it from the interactive time
+        self.profiler = None # CallbackProfiler timing the callbacks when profiling
+        self._ProfilerOverlay = None
+        self._RenderStart = None
+        self._LastOverlayUpdate = 0.
+        self.mouseMoveInterval = 1 / 60 # seconds, mouse moves are coalesced and only the latest is processed this often
+        self.maxStrokeGap = 10 # brush radii, the brush is only swept between cursor positions closer than this
+        self._MoveTimer = None # id of the timer that will process the latest mouse move
+        self._StrokePosition = None # cursor position the brush was last applied at, the next one sweeps from here
+        self.rayPicking = True # if True the cursor is picked by casting a ray against locator rather than by a pick of the rendered scene
+        self.locator = None # TriangleLocator of the mesh, in 'edit' mode built when first needed and dropped when vertices are deleted
 
 
 
@@ -267,23 +1793,109 @@ class MeshEditor:
                     self.VertexSelectionMode = None
                 else:
                     self.VertexSelectionMode = 'Brushing'
-
+                    self._StrokePosition = None # a new stroke
                     triggerSelectionUpdate()
                 self.plotter.set_background(self.BackgroundColor)
                 self.plotter.update()
+        def meshPointsChanged():
+            # (re)build the spatial index used for brush and nearest vertex queries and drop anything derived from the old mesh
+            self._PointTree = cKDTree(self.mesh.points)
+            self._InRadiusIndices = np.zeros(0,dtype=int)
+            self._GeodesicFront = None
+            self._StrokePosition = None
+            self.locator = None
+            self._LoggedSelection = self.SelectedVertices.copy()
+
+        ### Session log
+        def logEvent(kind, payload=b''):
+            if (self.sessionLog is not None) and (self._Replaying == False):
+                self.sessionLog.append(kind, payload)
+
+        def checkpointSelection(force=False):
+            # log the vertices whose selection changed since it was last logged, at most every checkpointInterval seconds
+            if (self.sessionLog is None) or self._Replaying:
+                return
+            now = time.monotonic()
+            if (force == False) and (now - self._LastCheckpoint < self.checkpointInterval):
+                return
+            self._LastCheckpoint = now
+            changed = np.flatnonzero(self.SelectedVertices != self._LoggedSelection)
+            if len(changed) > 0:
+                logEvent(SessionLog.ToggleSelection, changed.astype(np.int64).tobytes())
+                self._LoggedSelection[changed] = self.SelectedVertices[changed]
+
+        def replaySession():
+            # bring the editor to the state recorded in the session log
+            self._Replaying = True
+            for kind, payload in self.sessionLog.records():
+                if kind == SessionLog.Delete:
+                    deleteVertices(np.unpackbits(np.frombuffer(payload, dtype=np.uint8), count=self.mesh.n_points).astype(bool))
+                elif kind == SessionLog.Undo:
+                    undoDeletion()
+                elif kind == SessionLog.Redo:
+                    redoDeletion()
+                elif kind == SessionLog.ToggleSelection:
+                    inds = np.frombuffer(payload, dtype=np.int64)
+                    self.SelectedVertices[inds] = self.SelectedVertices[inds] == False
+                elif kind == SessionLog.AddLandmark:
+                    lm = np.frombuffer(payload, dtype=np.float64)
+                    placeLandmark(lm[:3], int(lm[6]), lm[3:6])
+                elif kind == SessionLog.DeleteLandmark:
+                    deleteLastLandmark()
+            self._Replaying = False
+            if self.mode == 'edit':
+                self._LoggedSelection = self.SelectedVertices.copy()
+                updateMeshVertexColors(full=True)
+            print('Resumed the session logged in ' + self.sessionLog.FileName)
+
+        def pickSurface():
+            # point of the mesh under the cursor, or None if the cursor is not over it
+            if self.rayPicking == False:
+                return self.plotter.pick_mouse_position()
+            if self.locator is None:
+                self.locator = TriangleLocator(self.mesh, self.topology.Faces)
+            if self.plotter.mouse_position is None:
+                self.plotter.store_mouse_position()
+            # ray from the near to the far clipping plane through the cursor
+            renderer = self.plotter.renderer
+            ends = []
+            for z in [0, 1]:
+                renderer.SetDisplayPoint(self.plotter.mouse_position[0], self.plotter.mouse_position[1], z)
+                renderer.DisplayToWorld()
+                world = np.array(renderer.GetWorldPoint())
+                ends.append(world[:3] / world[3])
+            hit = self.locator.intersectRay(ends[0], ends[1] - ends[0])
+            return None if hit is None else hit[0]
+
         def updatePointsInRadius(*args):
             # given the current cursor position work out which points of the mesh are within the brush sphere
             if self.VertexSelectionMode == 'Geodesic':
                     D = self.geodesicDistances
+                    inds = np.flatnonzero(D < self.brushRadius)
             else:
                 if len(args)>0:
                     pos = args[0]
                 else:
-                    pos = self.plotter.pick_mouse_position()
-                v0 = np.array(self.mesh.points - pos)
-                D = np.sqrt(np.sum(v0 ** 2, axis=1))
-
-            self.VerticesInRadius = D < self.brushRadius
+                    pos = pickSurface()
+                if pos is None: # cursor is not over the mesh
+                    inds = np.zeros(0,dtype=int)
+                elif self.GeodesicBrushing:
+                    # geodesic disc around the vertex nearest the cursor, only expanded as far as the brush radius
+                    dist,seed = self._PointTree.query(np.asarray(pos))
+                    if dist > self.brushRadius: # cursor is not over the mesh
+                        inds = np.zeros(0,dtype=int)
+                    else:
+                        if (self._GeodesicFront is None) or (self._GeodesicFront.Seed != seed):
+                            self._GeodesicFront = GeodesicFront(self.topology.Adjacency, seed, float(self.brushRadius))
+                        inds,_ = self._GeodesicFront.within(float(self.brushRadius))
+                else:
+                    # only visits the points near the brush rather than the whole mesh
+                    inds = np.array(self._PointTree.query_ball_point(np.asarray(pos),float(self.brushRadius)),dtype=int)
+            # clear the previous brush and flag the new one without reallocating the mask
+            self.VerticesInRadius[self._InRadiusIndices] = False
+            self.VerticesInRadius[inds] = True
+            self._DirtyVertices.extend((self._InRadiusIndices, inds))
+            self._InRadiusIndices = inds
 
 
         # these next 3 callbacks are attached to left, right or left double mouse clicks so will take the position of the click as an argument
@@ -302,7 +1914,6 @@ class MeshEditor:
                 currR = self.brushRadius
                 newR = currR + self.brushRadiusIncrement
                 self.brushRadius = newR
-                updateMeshVertexColors()
                 updatePointsInRadius()
                 updateMeshVertexColors()
 
@@ -320,23 +1931,50 @@ class MeshEditor:
 
         def addToSelection(*args):
             # add points within a given radius of mouse position (input to calllback) to the selection
-            self.SelectedVertices = self.SelectedVertices | self.VerticesInRadius
+            self.SelectedVertices[strokeIndices(*args)] = True
         def removeFromSelection(*args):
-            self.SelectedVertices = self.SelectedVertices & (self.VerticesInRadius == False)
-        def updateMeshVertexColors():
-            self.mesh.set_active_scalars("Colors")
-            self.plotter.update_scalars(self.VertexRGB, mesh=self.mesh)
+            self.SelectedVertices[strokeIndices(*args)] = False
+        def strokeIndices(*args):
+            # the vertices in the brush, plus those swept over since the last position of the stroke if the cursor position is given
+            # so that fast strokes don't leave gaps between mouse events
+            if (len(args) == 0) or (self.VertexSelectionMode != 'Brushing') or self.GeodesicBrushing:
+                return self._InRadiusIndices
+            last = self._StrokePosition
+            self._StrokePosition = None
+            if (args[0] is None) or (self._PointTree.query(args[0])[0] > self.brushRadius): # cursor is not over the mesh, the stroke restarts when it is
+                return self._InRadiusIndices
+            pos = np.asarray(args[0], dtype=float)
+            self._StrokePosition = pos
+            if (last is None) or (np.linalg.norm(pos - last) > self.maxStrokeGap * self.brushRadius):
+                return self._InRadiusIndices
+            inds = pointsNearSegment(self._PointTree, np.asarray(self.mesh.points), last, pos, float(self.brushRadius))
+            self._DirtyVertices.append(inds)
+            return inds
+        def updateMeshVertexColors(full=False):
+            # rewrite the persistent colour buffer of the displayed mesh in place - only the vertices that changed since the last update unless full is True
+            self.displayMesh.set_active_scalars("Colors")
+            colors = self.displayMesh.point_data["Colors"]
+            if full:
+                colors[:] = self.displayColors(np.arange(self.displayMesh.n_points))
+            elif len(self._DirtyVertices) > 0:
+                inds = np.unique(np.concatenate(self._DirtyVertices))
+                if self.displayProxy is not None:
+                    inds = self.displayProxy.proxiesOf(inds)
+                colors[inds] = self.displayColors(inds) # marks the vtk array as modified
+            self._DirtyVertices = []
+            self.plotter.render()
+            checkpointSelection()
 
         def triggerSelectionUpdate(*args):
             if self.vertexSelectionModeActive:
                 # update the selection of the vertices and the visualisation
-                pos = self.plotter.pick_mouse_position()
+                pos = pickSurface()
                 updatePointsInRadius(pos) # which points are now in the radius
                 if self.VertexSelectionMode == 'Brushing':
                     if self.BrushSelectionType == 'Select':
-                        addToSelection()
+                        addToSelection(pos)
                     elif self.BrushSelectionType == 'Deselect':
-                        removeFromSelection()
+                        removeFromSelection(pos)
                 updateMeshVertexColors()
         
         def leftClick(*args):
@@ -372,55 +2010,84 @@ class MeshEditor:
         ########### Vertex selection manipulation and deletion in 'edit' mode
         def invertVertexSelection():
             self.SelectedVertices = self.SelectedVertices == False
-            updateMeshVertexColors()
+            updateMeshVertexColors(full=True)
+
+        def setMesh(newMesh):
+            # swap the geometry of the edited mesh in place so the actor showing it doesn't need rebuilding
+            self.mesh.copy_from(newMesh, deep=False)
+            if self.displayProxy is not None:
+                self.displayProxy.update(np.asarray(self.mesh.points), self.topology.Faces, self.history.KeptVertices)
+                self.displayMesh["Colors"] = np.zeros([self.displayMesh.n_points, 3], dtype='uint8')
+            self.displayMesh.set_active_scalars("Colors")
 
         def deleteVertexSelection():
            # S["ClippingPoints"] = self.SelectedVertices;
-            self.mesh.remove_points(self.SelectedVertices.astype('bool'),inplace=True, keep_scalars=True)
-            self._RecordDeletions.append(self.SelectedVertices)
+            deleteVertices(self.SelectedVertices.astype('bool'))
+
+        def deleteVertices(mask):
+            logEvent(SessionLog.Delete, np.packbits(mask).tobytes())
+            setMesh(self.history.delete(self.topology, mask))
             self.SelectedVertices = np.zeros(self.mesh.n_points).astype('bool')
-            self.VerticesInRadius = self.SelectedVertices
-            updateMeshVertexColors()
+            self.VerticesInRadius = np.zeros(self.mesh.n_points).astype('bool')
+            meshPointsChanged()
+            updateMeshVertexColors(full=True)
 
-        
         def undoDeletion():
-            # remove current mesh actor
-            if len(self._RecordDeletions) > 0:
-                self.plotter.remove_actor(self.mesh_actor)
-                # make a new mesh from the copy
-                self.mesh = deepcopy(self._MeshCopy)
-                # remove last deletion from list
-                selection = self._RecordDeletions.pop(-1)
-                # apply deletions again in sequence except the last one
-                for i in range(len(self._RecordDeletions)):
-                    self.mesh.remove_points(self._RecordDeletions[i],inplace=True)
+            if self.history.CanUndo:
+                logEvent(SessionLog.Undo)
+                self.topology, newMesh, selection = self.history.undo()
+                setMesh(newMesh)
                 self.SelectedVertices = selection
                 self.VerticesInRadius = np.zeros_like(selection).astype('bool')
-                updateMeshVertexColors()
-                self.mesh_actor = self.plotter.add_mesh(self.mesh,pickable=True,scalars = "Colors",rgb=True)
-
-
-
-
+                meshPointsChanged()
+                updateMeshVertexColors(full=True)
+
+        def redoDeletion():
+            if self.history.CanRedo:
+                logEvent(SessionLog.Redo)
+                self.topology, newMesh = self.history.redo()
+                setMesh(newMesh)
+                self.SelectedVertices = np.zeros(self.mesh.n_points).astype('bool')
+                self.VerticesInRadius = np.zeros(self.mesh.n_points).astype('bool')
+                meshPointsChanged()
+                updateMeshVertexColors(full=True)
 
         def deleteInverseVertexSelection():
             invertVertexSelection()
             deleteVertexSelection()
+
+        def keepLargestConnectedComponent():
+            # delete every connected component except the largest, can be undone like any other deletion
+            mask = smallComponentMask(self.mesh, self.topology, keepLargest=True)
+            if mask.any():
+                deleteVertices(mask)
+
+        def deleteSmallConnectedComponents():
+            # delete the connected components with fewer than minComponentVertices vertices or less than minComponentArea surface area
+            mask = smallComponentMask(self.mesh, self.topology, self.minComponentVertices, self.minComponentArea)
+            if mask.any():
+                deleteVertices(mask)
         ######### End vertex manipulation and deletion in edot mode
         ######### Callbacks for adding  and deleting landmarks
         def addLandmark(pos):
             if self.landmarkSelectionModeActive:
-                lm = pv.Sphere(center=pos, radius=self.landmarkSize)
-                actor = self.plotter.add_mesh(lm, color='r')
-                self.landmarks.append(pos)
-                self.landmark_objects.append((lm, actor))
+                # snap the click onto the surface of the mesh
+                pos, face, bary, _ = self.locator.closestPoint(pos)
+                placeLandmark(pos, face, bary)
+
+        def placeLandmark(pos, face, bary):
+            logEvent(SessionLog.AddLandmark, np.concatenate((pos, bary, [face])).astype(np.float64).tobytes())
+            self.landmarkCloud.append(pos)
+            self._LandmarkFaces.append(face)
+            self._LandmarkBarycentric.append(bary)
 
         def deleteLastLandmark():
             # remove from viewer
-            if len(self.landmarks) > 0:
-                lm, actor = self.landmark_objects.pop(-1)
-                self.plotter.remove_actor(actor)
-                self.landmarks.pop(-1)
+            if len(self.landmarkCloud) > 0:
+                logEvent(SessionLog.DeleteLandmark)
+                self.landmarkCloud.pop()
+                self._LandmarkFaces.pop()
+                self._LandmarkBarycentric.pop()
             # pass
         ##### End callbacks fro landmrking and deleting landmarks
         ##### Callbacks to toggle between plotter mode
@@ -462,24 +2129,45 @@ class MeshEditor:
               #  self.plotter.track_mouse_position()
 
         def enterGeodesicSelection(*args):
-            pos = self.plotter.pick_mouse_position();
+            pos = pickSurface()
+            if pos is None: # cursor is not over the mesh
+                return
             self.VertexSelectionMode = 'Geodesic'
-            A= makeAdjacencyMatrix(self.mesh)
-            #self.mesh["ConnectedComponents"] = labelConnectedComponents(self.mesh)
-            v0 = self.mesh.points-pos
-            D = np.linalg.norm(v0,axis=1)
-            I = np.argmin(D)
+            A = self.topology.Adjacency
+            #self.mesh["ConnectedComponents"] = labelConnectedComponents(self.mesh, self.topology)
+            _,I = self._PointTree.query(pos) # nearest vertex to the cursor
             GD = dijkstra(A,directed=False,indices=I)
             self.geodesicDistances = GD
-            self.mesh.set_active_scalars("Colors")
-            self.brushRadius = np.max(GD[GD != np.Inf]) # select the whole connected component
+            self.brushRadius = np.max(GD[np.isfinite(GD)]) # select the whole connected component
             updatePointsInRadius(pos)
             updateMeshVertexColors()
 
+        def toggleGeodesicBrushing():
+            self.GeodesicBrushing = self.GeodesicBrushing == False
+            self._GeodesicFront = None
+            if self.vertexSelectionModeActive:
+                updatePointsInRadius()
+                updateMeshVertexColors()
+
         def mouseMoved(*args):
-            if self.VertexSelectionMode != 'Geodesic': # geodesic is too expensive to update on the fly
-                pos = self.plotter.pick_mouse_position()
-                triggerSelectionUpdate(pos)
+            # rather than picking for every event, which queue up when the cursor moves faster than the mesh redraws,
+            # the latest position is processed by a timer once per mouseMoveInterval
+            if self.VertexSelectionMode != 'Geodesic': # the geodesic selection stays centred on the vertex picked when entering it
+                if self._MoveTimer is None:
+                    self._MoveTimer = self.plotter.iren.create_timer(max(int(self.mouseMoveInterval * 1000), 1), repeating=False)
+                    if self._MoveTimer == 0: # the interactor is not running (e.g. off screen) so there are no timers
+                        self._MoveTimer = None
+                        processMouseMove()
+
+        def moveTimerFired(*args):
+            if (self._MoveTimer is not None) and (self.plotter.iren.interactor.GetTimerEventId() == self._MoveTimer):
+                self.plotter.iren.destroy_timer(self._MoveTimer)
+                self._MoveTimer = None
+                processMouseMove()
+
+        def processMouseMove():
+            if self.VertexSelectionMode != 'Geodesic':
+                triggerSelectionUpdate()
         def saveResult():
             # save the output depending on the mode
             fn = self.SaveFileName
@@ -490,21 +2178,67 @@ class MeshEditor:
                      os.makedirs(head)
             else:
                 print('Filename not specified...so file is not saved')
+            self._Saved = True
+            t = time.perf_counter()
             if self.mode == 'edit':
-                writePolyDataToObj(self.mesh, fn)
+                writePolyDataToObj(self.mesh, fn, self.topology)
                 self.plotter.background_color = [0, 0, 0]
                 #self.plotter.update()
             elif self.mode == 'landmark':
-                writeLandmarksToText(self.landmarks, fn)
+                writeLandmarks(self.landmarks, fn)
+                if self.LandmarkTable is not None:
+                    key = self.LandmarkKey
+                    if key is None:
+                        key = os.path.splitext(os.path.basename(fn))[0]
+                    LandmarkTable(self.LandmarkTable).append(key, self.landmarks)
                 self.plotter.background_color = [0, 0, 0]
                # self.plotter.update()
             else:
                 raise ValueError('Invalid mode')
+            self.SaveSeconds += time.perf_counter() - t
             print(fn+' saved')
+        ### Profiling
+        def renderStarted(*args):
+            self._RenderStart = time.perf_counter()
+
+        def renderEnded(*args):
+            if self._RenderStart is None:
+                return
+            self.profiler.record('render', time.perf_counter() - self._RenderStart)
+            self._RenderStart = None
+            # refresh the overlay a few times a second, it is drawn by the next render
+            now = time.monotonic()
+            if now - self._LastOverlayUpdate > .25:
+                self._LastOverlayUpdate = now
+                st = self.profiler.stats('render')
+                lines = ['frame ' + format(st['last'], '.1f') + ' ms, p95 ' + format(st['p95'], '.1f') + ' ms (' + format(1000 / max(st['mean'], 1e-3), '.0f') + ' fps)']
+                for name in self.profiler.names():
+                    if name != 'render':
+                        st = self.profiler.stats(name)
+                        lines.append(name + ' ' + format(st['p50'], '.1f') + ' / ' + format(st['p95'], '.1f') + ' ms')
+                self._ProfilerOverlay.SetText(2, '\n'.join(lines))
+
         ### end callback function definition
 
+        if profile:
+            # callbacks call each other through these names, so rebinding them times the calls made from other callbacks too
+            self.profiler = CallbackProfiler()
+            mouseMoved = self.profiler.wrap('mouseMoved', mouseMoved)
+            processMouseMove = self.profiler.wrap('processMouseMove', processMouseMove)
+            pickSurface = self.profiler.wrap('pickSurface', pickSurface)
+            triggerSelectionUpdate = self.profiler.wrap('triggerSelectionUpdate', triggerSelectionUpdate)
+            updatePointsInRadius = self.profiler.wrap('updatePointsInRadius', updatePointsInRadius)
+            updateMeshVertexColors = self.profiler.wrap('updateMeshVertexColors', updateMeshVertexColors)
+            enterGeodesicSelection = self.profiler.wrap('enterGeodesicSelection', enterGeodesicSelection)
+            deleteVertexSelection = self.profiler.wrap('deleteVertexSelection', deleteVertexSelection)
+            undoDeletion = self.profiler.wrap('undoDeletion', undoDeletion)
+            redoDeletion = self.profiler.wrap('redoDeletion', redoDeletion)
+            saveResult = self.profiler.wrap('saveResult', saveResult)
+
         # assign some attributes and opening settings
         self.SaveFileName = saveFileName
+        self.LandmarkTable = landmarkTable
+        self.LandmarkKey = landmarkKey
         self.landmarkSize = landmark_size
         self.BrushSelectionType = 'Deselect'
         self.mesh = S
@@ -512,15 +2246,29 @@ class MeshEditor:
         self.landmarkSelectionModeActive = False
         self.VertexSelectionMode = None
         self.mode = mode.lower()
+        if sessionLog & (saveFileName is not None):
+            head, _ = os.path.split(saveFileName)
+            if (head != '') and (os.path.isdir(head) == False):
+                os.makedirs(head)
+            self.sessionLog = SessionLog(saveFileName + '.session', S)
         # create pyvista plotter
         P = pv.Plotter()
         self.plotter = P
         if mode.lower() == 'edit':
-            self.brushRadius = np.array([meshRadius(self.mesh.points) / 1.2])  # default brush size
-            minE,medE = minMedEdgeLength(S)
-            self.brushRadiusIncrement = np.array([meshRadius(self.mesh.points) / 20])
+            self.brushRadius = meshRadius(self.mesh.points) / 1.2  # default brush size
+            self.topology = MeshTopology(S)
+            minE,medE = minMedEdgeLength(S, self.topology)
+            self.brushRadiusIncrement = meshRadius(self.mesh.points) / 20
             self.minBrushSize = minE/2
-            self.mesh["Colors"] = self.VertexRGB
+            self.minComponentVertices = max(S.n_points // 100, 1) # components smaller than this are deleted by 'n'
+            self.minComponentArea = None # if set, components with less surface area than this are also deleted by 'n'
+            if (displayFaces is not None) and (self.topology.Faces.shape[0] > displayFaces):
+                self.displayProxy = DisplayProxy(S, displayFaces, self.topology)
+                self.displayMesh = self.displayProxy.Mesh
+            else:
+                self.displayMesh = self.mesh
+            self.displayMesh["Colors"] = self.displayColors(np.arange(self.displayMesh.n_points))
+            meshPointsChanged()
             self.plotter.add_key_event('t', toggleVertexSelectionMode)
             self.plotter.add_key_event('i', invertVertexSelection)
             self.plotter.add_key_event('Delete', deleteVertexSelection)
@@ -528,7 +2276,11 @@ class MeshEditor:
             self.plotter.add_key_event('2', increaseBrushRadius)
             self.plotter.add_key_event('1', decreaseBrushRadius)
             self.plotter.add_key_event('z',undoDeletion)
+            self.plotter.add_key_event('x',redoDeletion)
             self.plotter.add_key_event('g', enterGeodesicSelection)
+            self.plotter.add_key_event('h', toggleGeodesicBrushing)
+            self.plotter.add_key_event('k', keepLargestConnectedComponent)
+            self.plotter.add_key_event('n', deleteSmallConnectedComponents)
             self.plotter.track_click_position(leftClick, side='left')
             self.plotter.track_click_position(rightClick, side='right')
       #      self.plotter.track_click_position(enterGeodesicSelection, side='left', double=True)
@@ -537,9 +2289,12 @@ class MeshEditor:
             self.plotter.set_background([0.5, 0.5, 0.5])
             self.plotter.track_mouse_position()
             self.plotter.iren.add_observer("MouseMoveEvent", mouseMoved)
-            actor = self.plotter.add_mesh(self.mesh, pickable=True, scalars="Colors",rgb=True)
+            self.plotter.iren.add_observer("TimerEvent", moveTimerFired)
+            actor = self.plotter.add_mesh(self.displayMesh, pickable=True, scalars="Colors",rgb=True)
             self.mesh_actor = actor
-            self._MeshCopy = deepcopy(S);
+            self.history = DeletionHistory(S, self.topology)
+            if (self.sessionLog is not None) and (len(self.sessionLog) > 0):
+                replaySession()
             self.vertexSelectionModeActive = True
             self.plotter.renderer.disable()  # disable camera interaction
 
@@ -553,8 +2308,15 @@ class MeshEditor:
 
         elif mode.lower() == 'landmark':
             self.plotter.add_key_event('t', toggleLandmarkSelectionMode)
-            self.landmarks = list()
-            self.landmark_objects = list()
+            self.locator = TriangleLocator(S) # landmarks are snapped to the nearest point on the surface
+            self.landmarkCloud = LandmarkCloud(self.plotter, self.landmarkSize)
+            self._LandmarkFaces = GrowableArray((), dtype=int)
+            self._LandmarkBarycentric = GrowableArray((3,))
+            if (self.sessionLog is not None) and (len(self.sessionLog) > 0):
+                replaySession() # includes any template landmarks placed when the session started
+            elif templateLandmarks is not None:
+                for pos, face, bary in zip(*projectLandmarks(S, templateLandmarks, self.locator)):
+                    placeLandmark(pos, face, bary)
             toggleLandmarkSelectionMode()
             self.plotter.add_key_event('Delete', deleteLastLandmark)
             self.plotter.add_mesh(S, pickable=True)
@@ -564,7 +2326,24 @@ class MeshEditor:
         self.plotter.add_key_event('a', saveResult)
         self.plotter.add_key_event('y',lambda: self.plotter.view_xz())
         self.plotter.view_xy()
+        if self.profiler is not None:
+            self.plotter.pick_mouse_position = self.profiler.wrap('pick_mouse_position', self.plotter.pick_mouse_position)
+            self._ProfilerOverlay = self.plotter.add_text('', position='upper_left', font_size=8, color='white')
+            self.plotter.ren_win.AddObserver('StartEvent', renderStarted)
+            self.plotter.ren_win.AddObserver('EndEvent', renderEnded)
         self.plotter.show()
+        if self.profiler is not None:
+            print(self.profiler.summary())
+            if isinstance(profile, str):
+                self.profiler.save(profile)
+        if self.sessionLog is not None:
+            # the log is only needed to resume a session that ended without saving
+            if self.mode == 'edit':
+                checkpointSelection(force=True)
+            if self._Saved:
+                self.sessionLog.delete()
+            else:
+                self.sessionLog.close()
 
 
 class BatchMeshEditor:
@@ -575,14 +2354,29 @@ class BatchMeshEditor:
         self.Overwrite = False
         self._Mode = 'landmark'
         self.FileProcessingInfo = None
-        self.PreLoadObjs = True
         self.ConvertToVtk = False
         self.InputFileType = '.obj'
         self.PreserveSubFolders = True
         self.LandmarkSize = 4
-        self.PreLoadObjs = True
+        self.DisplayFaces = None # if set, meshes with more triangles than this are shown through a coarse proxy in 'edit' mode
+        self.TemplateLandmarks = None # if set (n x 3 array), these are projected onto each mesh as a starting point in 'landmark' mode
+        self.LandmarkFileType = '.txt' # '.txt' (comma delimited) or '.npy' (binary) landmark files in 'landmark' mode
+        self.LandmarkTable = None # if set to a file name, landmarks are also appended to this LandmarkTable keyed by sub folder and file name
+        self.SessionLogs = True # if True edits are logged next to each output file so that a session that crashes can be resumed
+        self.Profile = False # if True the editor's callbacks are timed, with the frame time shown on screen and a summary printed for each file
+        self.MeshCacheBudget = 2 * 2**30 # bytes of meshes kept in memory, loaded up front in prepareFiles and then on demand
+        self._MeshCache = None
         self._InFiles = None
         self._OutFiles = None
+        self.CacheDirectory = None # if set, cleaned meshes are cached here so that later loads of the same file are fast
+        self.PrefetchDepth = 2 # number of upcoming files loaded in the background while editing
+        self.PrefetchProcesses = False # if True the upcoming files are loaded in separate processes rather than threads
+        self.ConversionWorkers = 1 # number of processes used for ConvertToVtk
+        self.ConversionErrors = [] # (input path, error message) of each file that failed to convert
+        self.ManifestFile = None # if set, a json record of the files in SourcePath so that later runs only rescan changed folders
+        self._Manifest = None
+        self.MetricsFile = None # if set, per file timings and bytes are appended to this json lines file, see BatchMetrics
+        self.Metrics = None # BatchMetrics of the last run
         self._Testing = False  # for deevelopment only
 
     # dependent properties
@@ -660,19 +2454,19 @@ class BatchMeshEditor:
 
         if self.ConvertToVtk:
             # find files that don't have a vtk counterpart in the original directory
-            [inObj,outVtk] = findFiles(self.SourcePath,self.InputFileType,self.SourcePath,True,'converttovtk')
-            inObj,outVtk = removeExistingFiles(inObj,outVtk)
-            for i in range(len(inObj)):
-                print('Converting shape ' + str(i) +' of ' + str(len(inObj)))
-                shp,_ = load3DImage(inObj[i])
-                if shp is not None:
-                    shp.save(dictToPath(outVtk[i]),binary=True,texture = True)
+            self._Manifest = FileManifest(self.SourcePath, self.ManifestFile)
+            [inObj,outVtk] = findFiles(self.SourcePath,self.InputFileType,self.SourcePath,True,'converttovtk', self._Manifest)
+            inObj,outVtk = removeUpToDateFiles(inObj,outVtk)
+            self.convertFiles(inObj, outVtk)
             inType = '.vtk' # moving forward the vtk files will be the input files
         else:
             inType=self.InputFileType
 
+        t = time.perf_counter()
+        self._Manifest = FileManifest(self.SourcePath, self.ManifestFile) # rescans anything converted above
         [inFiles, outFiles] = findFiles(self.SourcePath,inType, self.DestinationPath,
-                                        self.PreserveSubFolders, self.Mode)
+                                        self.PreserveSubFolders, self.Mode, self._Manifest,
+                                        self.LandmarkFileType if self.Mode == 'landmark' else None)
 
 
 
@@ -682,34 +2476,239 @@ class BatchMeshEditor:
         if self._Testing:
             inFiles = inFiles[0:5]
             outFiles = outFiles[0:5]
-        if self.PreLoadObjs:
-            for i in range(len(inFiles)):
-                print('Loading image ' + str(i) + ' of' + str(len(inFiles)))
-                load3DImage(inFiles[i])
+        self.Metrics = BatchMetrics(self.MetricsFile)
+        self.Metrics.discovery(time.perf_counter() - t, len(inFiles), source=self.SourcePath, mode=self.Mode)
+        # preload as many meshes as fit in the cache, the rest are loaded while editing
+        self._MeshCache = MeshCache(inFiles, self.MeshCacheBudget, self.CacheDirectory)
+        for i in range(len(inFiles)):
+            print('Loading image ' + str(i) + ' of' + str(len(inFiles)))
+            if self._MeshCache.preload(i) == False:
+                break
         self._InFiles = inFiles
         self._OutFiles = outFiles
         print('Ready to process ' + str(len(self._InFiles)) + ' files')
 
+    def convertFiles(self, inFiles, outFiles):
+        # convert files to vtk on ConversionWorkers processes, collecting failures in ConversionErrors
+        self.ConversionErrors = []
+        nFiles = len(inFiles)
+        if self.ConversionWorkers == 1:
+            results = (convertFileToVtk(inFiles[i], outFiles[i], self.CacheDirectory) for i in range(nFiles))
+            self._collectConversions(results, nFiles)
+        else:
+            with ProcessPoolExecutor(max_workers=self.ConversionWorkers) as pool:
+                futures = [pool.submit(convertFileToVtk, inFiles[i], outFiles[i], self.CacheDirectory) for i in range(nFiles)]
+                self._collectConversions((f.result() for f in as_completed(futures)), nFiles)
+        if len(self.ConversionErrors) > 0:
+            print(str(len(self.ConversionErrors)) + ' files could not be converted, see ConversionErrors')
+
+    def _collectConversions(self, results, nFiles):
+        for i, (fn, err) in enumerate(results):
+            if err is None:
+                print('Converted shape ' + str(i + 1) + ' of ' + str(nFiles))
+            else:
+                print('Failed to convert shape ' + str(i + 1) + ' of ' + str(nFiles) + ': ' + fn)
+                self.ConversionErrors.append((fn, err))
+
     def processFiles(self):
+        if self._MeshCache is None:
+            self._MeshCache = MeshCache(self._InFiles, self.MeshCacheBudget, self.CacheDirectory)
+        # load the next files in the background while editing
+        prefetcher = MeshPrefetcher(self._InFiles, self.PrefetchDepth, self.CacheDirectory, self._MeshCache, self.PrefetchProcesses)
+        if self.Metrics is None:
+            self.Metrics = BatchMetrics(self.MetricsFile)
+        self.Metrics.start(len(self._InFiles))
+        try:
+            self._processFiles(prefetcher)
+        finally:
+            prefetcher.close()
+            print(self._MeshCache.report())
+            self.Metrics.finish()
+
+    def _processFiles(self, prefetcher):
         for i in range(len(self._InFiles)):
             # bullet proof against ever saving an infile with the wrong corresponding outfile name
             if self._InFiles[i]['fileName'] != self._OutFiles[i]['fileName']:
                 raise ValueError('Input and output filenames don\'t match. This requires investigation')
             currF = self._InFiles[i]
 
-            if self.PreLoadObjs == False: # load the polydata into the file dictionary
-                load3DImage(currF)
-            mesh = currF['polydata']
+            t = time.perf_counter()
+            mesh = prefetcher.get(i)
+            wait = time.perf_counter() - t
+            timings = prefetcher.loadTimings(i)
+            timings.pop('cached', None)
             if mesh is None:
                 print(dictToPath(currF) + ' is missing or cant be loaded')
+                self.Metrics.file(dictToPath(currF), 'could not be loaded', wait=wait, total=wait, **timings)
                 continue
             fn = dictToPath(self._OutFiles[i])
             path, _ = os.path.split(fn)
             if os.path.isdir(path) == False:
                 os.makedirs(path)
             print('Processing image ' + str(i) + 'of ' + str(len(self._InFiles)))
-            MeshEditor(mesh, self.Mode, landmark_size=self.LandmarkSize,
-                             saveFileName=fn)
+            nPoints = mesh.n_points
+            t = time.perf_counter()
+            editor = MeshEditor(mesh, self.Mode, landmark_size=self.LandmarkSize,
+                             saveFileName=fn, displayFaces=self.DisplayFaces, templateLandmarks=self.TemplateLandmarks,
+                             landmarkTable=self.LandmarkTable, sessionLog=self.SessionLogs, profile=self.Profile,
+                             landmarkKey='/'.join([x for x in [currF['subPath'].replace(os.sep, '/'), currF['fileName']] if x != '']))
+            editSeconds = time.perf_counter() - t
+            self.Metrics.file(dictToPath(currF), None, wait=wait, interactive=editSeconds - editor.SaveSeconds,
+                              save=editor.SaveSeconds, bytesWritten=os.path.getsize(fn) if os.path.isfile(fn) else 0,
+                              total=wait + editSeconds, n_points=nPoints, **timings)
+            print('Finished image ' + str(i) + ', ' + self.Metrics.progress())
+            self._MeshCache.discard(i) # the edited mesh is not needed any more
+
+
+######## Operations for BatchMeshProcessor
+# each takes a mesh and the dictionary of the file it came from and returns the processed mesh
+
+def cleanMesh(shp, fileDict=None):
+    return shp.clean()
+
+def triangulateMesh(shp, fileDict=None):
+    return shp.triangulate()
+
+def keepLargestComponent(shp, fileDict=None):
+    # deletes everything except the connected component with the most vertices
+    topology = MeshTopology(shp)
+    return removeVertices(shp, smallComponentMask(shp, topology, keepLargest=True), topology)[0]
+
+def deleteSmallComponents(shp, fileDict=None, minVertices=None, minArea=None):
+    # deletes the connected components with fewer than minVertices vertices or less than minArea surface area
+    topology = MeshTopology(shp)
+    return removeVertices(shp, smallComponentMask(shp, topology, minVertices, minArea), topology)[0]
+
+def removeSmallComponents(minVertices=None, minArea=None):
+    # operation deleting the connected components with fewer than minVertices vertices or less than minArea surface area
+    return partial(deleteSmallComponents, minVertices=minVertices, minArea=minArea)
+
+def deleteMaskedVertices(shp, fileDict, maskDirectory):
+    # deletes the vertices flagged in a boolean .npy mask saved as maskDirectory/subPath/fileName.npy
+    mask = np.load(os.path.join(maskDirectory, fileDict['subPath'], fileDict['fileName'] + '.npy'))
+    if mask.shape != (shp.n_points,):
+        raise ValueError('Mask does not match the number of vertices of the mesh')
+    return removeVertices(shp, mask.astype(bool))[0]
+
+def applySelectionMask(maskDirectory):
+    # operation deleting the vertices flagged in the masks saved in maskDirectory
+    return partial(deleteMaskedVertices, maskDirectory=maskDirectory)
+
+MeshOperations = {'clean': cleanMesh,
+                  'triangulate': triangulateMesh,
+                  'largestcomponent': keepLargestComponent}
+
+
+def processMeshFile(inFile, outFile, operations, cacheDir=None):
+    # loads a file, applies the operations in sequence and saves the result
+    # returns the input path, an error message (None on success) and the timings and bytes for BatchMetrics
+    # defined at module level so that it can run in a process pool
+    start = time.perf_counter()
+    metrics = dict()
+    try:
+        shp,_ = load3DImage(inFile, cacheDir, metrics)
+        if shp is None:
+            return dictToPath(inFile), 'could not be loaded', metrics
+        metrics['n_points'] = shp.n_points
+        metrics['operationSeconds'] = dict()
+        t = time.perf_counter()
+        for op in operations:
+            t0 = time.perf_counter()
+            shp = op(shp, inFile)
+            name = getattr(op, 'func', op).__name__
+            metrics['operationSeconds'][name] = metrics['operationSeconds'].get(name, 0.) + time.perf_counter() - t0
+        metrics['operations'] = time.perf_counter() - t
+        fn = dictToPath(outFile)
+        path, _ = os.path.split(fn)
+        if os.path.isdir(path) == False:
+            os.makedirs(path, exist_ok=True)
+        t = time.perf_counter()
+        if outFile['ext'] == '.obj':
+            writePolyDataToObj(shp, fn)
+        else:
+            shp.save(fn, binary=True)
+        metrics['save'] = time.perf_counter() - t
+        metrics['bytesWritten'] = os.path.getsize(fn)
+    except Exception as e:
+        return dictToPath(inFile), str(e), metrics
+    finally:
+        inFile['polydata'] = None # not needed any more
+        metrics['total'] = time.perf_counter() - start
+        metrics.pop('cached', None)
+    return dictToPath(inFile), None, metrics
+
+
+class BatchMeshProcessor:
+    # applies a list of operations to every file in SourcePath without user interaction or a plotter
+    # Operations are names in MeshOperations or callables taking (mesh, file dictionary) and returning a mesh
+    # callables must be defined at module level (or be functools.partial of one) when Workers > 1
+    def __init__(self):
+        self.SourcePath = None
+        self.DestinationPath = None
+        self.InputFileType = '.obj'
+        self.OutputFileType = '.obj' # '.obj' or '.vtk'
+        self.PreserveSubFolders = True
+        self.Overwrite = False
+        self.Operations = ['largestcomponent']
+        self.Workers = 1 # number of processes
+        self.CacheDirectory = None
+        self.Errors = [] # (input path, error message) of each file that failed
+        self.MetricsFile = None # if set, per file timings and bytes are appended to this json lines file, see BatchMetrics
+        self.Metrics = None # BatchMetrics of the last run
+        self._InFiles = None
+        self._OutFiles = None
 
+    @property
+    def OperationFunctions(self):
+        return [MeshOperations[op.lower()] if isinstance(op, str) else op for op in self.Operations]
 
+    def prepareFiles(self):
+        if os.path.isdir(self.SourcePath) == False:
+            raise ValueError('Source path does not exist or is not a directory')
+        if self.DestinationPath is None:
+            raise ValueError('Destination path must be set')
+        if self.SourcePath == self.DestinationPath:
+            raise ValueError('Source and destination paths cannot be the same')
+        if self.OutputFileType == '.obj':
+            mode = 'edit'
+        elif self.OutputFileType == '.vtk':
+            mode = 'converttovtk'
+        else:
+            raise ValueError('OutputFileType must be .obj or .vtk')
+        t = time.perf_counter()
+        inFiles, outFiles = findFiles(self.SourcePath, self.InputFileType, self.DestinationPath,
+                                      self.PreserveSubFolders, mode)
+        if self.Overwrite == False:
+            inFiles, outFiles = removeExistingFiles(inFiles, outFiles)
+        self.Metrics = BatchMetrics(self.MetricsFile)
+        self.Metrics.discovery(time.perf_counter() - t, len(inFiles), source=self.SourcePath, operations=[str(op) for op in self.Operations])
+        self._InFiles = inFiles
+        self._OutFiles = outFiles
+        print('Ready to process ' + str(len(self._InFiles)) + ' files')
 
+    def processFiles(self):
+        ops = self.OperationFunctions
+        self.Errors = []
+        nFiles = len(self._InFiles)
+        if self.Metrics is None:
+            self.Metrics = BatchMetrics(self.MetricsFile)
+        self.Metrics.start(nFiles)
+        if self.Workers == 1:
+            results = (processMeshFile(self._InFiles[i], self._OutFiles[i], ops, self.CacheDirectory) for i in range(nFiles))
+            self._collectResults(results, nFiles)
+        else:
+            with ProcessPoolExecutor(max_workers=self.Workers) as pool:
+                futures = [pool.submit(processMeshFile, self._InFiles[i], self._OutFiles[i], ops, self.CacheDirectory) for i in range(nFiles)]
+                self._collectResults((f.result() for f in as_completed(futures)), nFiles)
+        self.Metrics.finish()
+        if len(self.Errors) > 0:
+            print(str(len(self.Errors)) + ' files could not be processed, see Errors')
+
+    def _collectResults(self, results, nFiles):
+        for i, (fn, err, metrics) in enumerate(results):
+            self.Metrics.file(fn, err, **metrics)
+            if err is None:
+                print('Processed file ' + str(i + 1) + ' of ' + str(nFiles) + ' in ' + self.Metrics.progress())
+            else:
+                print('Failed to process file ' + str(i + 1) + ' of ' + str(nFiles) + ': ' + fn)
+                self.Errors.append((fn, err))